@@ -1,5 +1,5 @@
 import streamlit as st
-from tools.db import init_db, seed_database
+from tools.bootstrap import bootstrap_database
 from ui import topbar
 from pages import (
     booking_page, login_page, register_page, booking_guest_page,booking_partner_page,my_hotels_page,
@@ -45,7 +45,7 @@ def load_css(path="assets/app.css"):
 # --- app setup ---
 st.set_page_config(page_title="Hotel Booking System", page_icon="🏨", layout="wide")
 load_css()
-init_db(); seed_database()
+bootstrap_database()   # схема и сид — один раз на процесс
 
 # --- session defaults ---
 ss = st.session_state
@@ -1,12 +1,13 @@
 from __future__ import annotations
-from typing import Tuple, Optional, List, NamedTuple
-from functools import lru_cache
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterable, Tuple, Optional, List, NamedTuple
 from datetime import date, timedelta
 
-from core.domain import Price, Availability, Rule
+from core.domain import Price, Availability, Rule, PriceBatch, AvailabilityBatch
 from core.dates import month_grid_bounds, to_iso
-from core.indexes import index_prices_by_rate_date, index_avail_by_rt_date
-from core.rules import is_cta_date, is_ctd_date
+from core.indexes import DenseInventory, MISSING
+from core.rules import compile_rules
 
 class DayCell(NamedTuple):
     d_iso: str
@@ -14,35 +15,36 @@ class DayCell(NamedTuple):
     available: bool             # остаток > 0
     flags: tuple[str, ...]      # ('cta','ctd','soldout')
 
-@lru_cache(maxsize=512)
 def build_price_calendar(
     room_type_id: int,
     rate_id: int,
     month_start: date,
-    prices: Tuple[Price, ...],
-    avails: Tuple[Availability, ...],
+    prices: Iterable[Price] | PriceBatch,
+    avails: Iterable[Availability] | AvailabilityBatch,
     rules: Tuple[Rule, ...],
 ) -> List[List[DayCell]]:
-    p_idx = index_prices_by_rate_date(prices)
-    a_idx = index_avail_by_rt_date(avails)
+    compiled = compile_rules(rules)
 
     start, end = month_grid_bounds(month_start)
+    inv = DenseInventory(prices, avails, start.toordinal(), end.toordinal(),
+                         rate_ids=(rate_id,), room_type_ids=(room_type_id,))
+    price_vec = inv.price_vector(rate_id)
+    avail_vec = inv.avail_vector(room_type_id)
     days_total = (end - start).days
 
     grid: List[List[DayCell]] = []
     row: List[DayCell] = []
     cur = start
 
-    for _ in range(days_total):
+    for i in range(days_total):
         iso = to_iso(cur)
-        amount = p_idx.get((rate_id, iso))
-        left = a_idx.get((room_type_id, iso), 0)
-        available = left > 0
+        amount = price_vec[i] if price_vec[i] != MISSING else None
+        available = avail_vec[i] > 0
 
         flags: list[str] = []
-        if is_cta_date(rules, room_type_id, rate_id, iso):
+        if compiled.is_cta(room_type_id, rate_id, iso):
             flags.append("cta")
-        if is_ctd_date(rules, room_type_id, rate_id, iso):
+        if compiled.is_ctd(room_type_id, rate_id, iso):
             flags.append("ctd")
         if not available:
             flags.append("soldout")
@@ -57,3 +59,42 @@ def build_price_calendar(
     if row:
         grid.append(row)
     return grid
+
+
+class CalendarCache:
+    """LRU готовых сеток по ключу (room_type_id, rate_id, month_start, version).
+
+    version — версии данных пары (tools.db.calendar_data_versions()): попадание
+    не требует ни выборки цен/остатков/правил, ни хеширования их кортежей.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._grids: "OrderedDict[tuple, List[List[DayCell]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(room_type_id: int, rate_id: int, month_start: date, version: Hashable) -> tuple:
+        return (room_type_id, rate_id, month_start, version)
+
+    def get(self, key: tuple) -> Optional[List[List[DayCell]]]:
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+            return grid
+
+    def put(self, key: tuple, grid: List[List[DayCell]]) -> List[List[DayCell]]:
+        with self._lock:
+            self._grids[key] = grid
+            self._grids.move_to_end(key)
+            while len(self._grids) > self.maxsize:
+                self._grids.popitem(last=False)
+        return grid
+
+    def clear(self):
+        with self._lock:
+            self._grids.clear()
+
+
+calendar_cache = CalendarCache()
@@ -4,12 +4,69 @@ from typing import Iterator
 
 ISO_FMT = "%Y-%m-%d"
 
-def to_date(s: str) -> date:
+# Предвычисленная таблица ISO <-> date для активного горизонта бронирования:
+# в горячих циклах (quote_offer, календарь, lazy_offers) конвертация — один dict-lookup.
+HORIZON_PAST_DAYS = 366
+HORIZON_FUTURE_DAYS = 2 * 366
+
+_iso_to_date: dict[str, date] = {}
+_date_to_iso: dict[date, str] = {}
+
+def set_date_horizon(start: date, end: date) -> None:
+    """Пересобирает таблицу на полуинтервал [start, end); вне его — fromisoformat/isoformat."""
+    iso_to_date: dict[str, date] = {}
+    date_to_iso: dict[date, str] = {}
+    for n in range(start.toordinal(), end.toordinal()):
+        d = date.fromordinal(n)
+        iso = d.isoformat()
+        iso_to_date[iso] = d
+        date_to_iso[d] = iso
+    global _iso_to_date, _date_to_iso
+    _iso_to_date, _date_to_iso = iso_to_date, date_to_iso
+
+def _strptime_date(s: str) -> date:
     return datetime.strptime(s, ISO_FMT).date()
 
-def to_iso(d: date) -> str:
+def _strftime_iso(d: date) -> str:
     return d.strftime(ISO_FMT)
 
+def to_date(s: str) -> date:
+    d = _iso_to_date.get(s)
+    if d is not None:
+        return d
+    if len(s) == 10 and s[4] == "-" and s[7] == "-":
+        try:
+            return date.fromisoformat(s)
+        except ValueError:
+            pass
+    # нестандартная запись ('2025-1-5') и ошибки — с прежней семантикой strptime
+    return _strptime_date(s)
+
+def to_iso(d: date) -> str:
+    iso = _date_to_iso.get(d)
+    if iso is not None:
+        return iso
+    # datetime.isoformat() добавил бы время
+    return d.isoformat() if type(d) is date else _strftime_iso(d)
+
+_today = date.today()
+set_date_horizon(_today - timedelta(days=HORIZON_PAST_DAYS), _today + timedelta(days=HORIZON_FUTURE_DAYS))
+del _today
+
+# Порядковый номер дня (date.toordinal(): 0001-01-01 -> 1) — компактный ключ дат
+# в prices.day/availability.day и индексах; в ISO переводим только на границе с UI.
+def to_ordinal(d: date) -> int:
+    return d.toordinal()
+
+def from_ordinal(n: int) -> date:
+    return date.fromordinal(n)
+
+def iso_to_ordinal(s: str) -> int:
+    return to_date(s).toordinal()
+
+def ordinal_to_iso(n: int) -> str:
+    return to_iso(date.fromordinal(n))
+
 def daterange(d1: date, d2: date) -> Iterator[date]:
     """ полуинтервал [d1, d2) — правая граница исключена """
     cur = d1
@@ -1,5 +1,8 @@
+from array import array
 from dataclasses import dataclass,field
-from typing import Tuple, Optional, Dict
+from typing import Iterable, Iterator, List, Tuple, Optional, Dict, overload
+
+from core.dates import iso_to_ordinal, ordinal_to_iso
 
 @dataclass(frozen=True)
 class Hotel:
@@ -28,20 +31,22 @@ class RatePlan:
     refundable: bool
     cancel_before_days: Optional[int]
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Price:
     id: int
     rate_id: int
     date: str
     amount: int
     currency: str
+    day: Optional[int] = None  # date.toordinal(); None — не заполнен
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Availability:
     id: int
     room_type_id: int
     date: str
     available: int
+    day: Optional[int] = None  # date.toordinal(); None — не заполнен
 
 @dataclass(frozen=True)
 class Guest:
@@ -82,8 +87,121 @@ class Event:
     name: str
     payload: Dict= field(compare=False)
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Rule:
     id: int
     kind: str
     payload: Dict= field(compare=False)
+
+
+class WindowMins(dict):
+    """rate_id -> минимальная доступная цена в окне window_days дней от сегодня (None — нет такой).
+
+    Окно хранится вместе со значениями, чтобы минимумы не приняли за окно другой длины.
+    room_types — rate_id -> тип номера, по остатку которого взят минимум (None — только
+    по ценам); не задан — минимумы уже учитывают типы номеров тарифов.
+    """
+    __slots__ = ("window_days", "room_types")
+
+    def __init__(self, window_days: int, mins: Iterable = (), room_types: Optional[Dict[int, Optional[int]]] = None):
+        super().__init__(mins)
+        self.window_days = window_days
+        self.room_types = room_types
+
+    def covers(self, rate_id: int, room_type_id: int) -> bool:
+        """Есть ли минимум тарифа, учитывающий остатки room_type_id."""
+        if rate_id not in self:
+            return False
+        return self.room_types is None or self.room_types.get(rate_id) == room_type_id
+
+
+# Колоночные контейнеры: строки цен/остатков как параллельные массивы
+# (8 байт на число вместо объекта на строку). Строка материализуется только
+# при обращении: batch[i] / итерация отдают обычные Price/Availability.
+
+class PriceBatch:
+    __slots__ = ("ids", "rate_ids", "days", "amounts", "currencies")
+
+    def __init__(self, rows: Iterable[tuple] = ()):
+        """rows: (id, rate_id, date_iso, amount, currency[, day])."""
+        self.ids = array("q")
+        self.rate_ids = array("q")
+        self.days = array("q")
+        self.amounts = array("q")
+        self.currencies: List[str] = []
+        for row in rows:
+            self.append(*row)
+
+    def append(self, id: int, rate_id: int, date: str, amount: int, currency: str, day: Optional[int] = None):
+        self.ids.append(id)
+        self.rate_ids.append(rate_id)
+        self.days.append(day if day is not None else iso_to_ordinal(date))
+        self.amounts.append(amount)
+        self.currencies.append(currency)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @overload
+    def __getitem__(self, i: int) -> Price: ...
+    @overload
+    def __getitem__(self, i: slice) -> "PriceBatch": ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            out = PriceBatch()
+            out.ids, out.rate_ids, out.days = self.ids[i], self.rate_ids[i], self.days[i]
+            out.amounts, out.currencies = self.amounts[i], self.currencies[i]
+            return out
+        day = self.days[i]
+        return Price(self.ids[i], self.rate_ids[i], ordinal_to_iso(day), self.amounts[i], self.currencies[i], day)
+
+    def __iter__(self) -> Iterator[Price]:
+        for i in range(len(self.ids)):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        return f"PriceBatch({len(self)} rows)"
+
+
+class AvailabilityBatch:
+    __slots__ = ("ids", "room_type_ids", "days", "available")
+
+    def __init__(self, rows: Iterable[tuple] = ()):
+        """rows: (id, room_type_id, date_iso, available[, day])."""
+        self.ids = array("q")
+        self.room_type_ids = array("q")
+        self.days = array("q")
+        self.available = array("q")
+        for row in rows:
+            self.append(*row)
+
+    def append(self, id: int, room_type_id: int, date: str, available: int, day: Optional[int] = None):
+        self.ids.append(id)
+        self.room_type_ids.append(room_type_id)
+        self.days.append(day if day is not None else iso_to_ordinal(date))
+        self.available.append(available)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @overload
+    def __getitem__(self, i: int) -> Availability: ...
+    @overload
+    def __getitem__(self, i: slice) -> "AvailabilityBatch": ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            out = AvailabilityBatch()
+            out.ids, out.room_type_ids = self.ids[i], self.room_type_ids[i]
+            out.days, out.available = self.days[i], self.available[i]
+            return out
+        day = self.days[i]
+        return Availability(self.ids[i], self.room_type_ids[i], ordinal_to_iso(day), self.available[i], day)
+
+    def __iter__(self) -> Iterator[Availability]:
+        for i in range(len(self.ids)):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        return f"AvailabilityBatch({len(self)} rows)"
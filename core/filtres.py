@@ -1,4 +1,6 @@
-from typing import Any, Callable, Iterable, Iterator, Sequence, Dict, List
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence, Dict, List, Tuple
 
 Predicate = Callable[[Any], bool]
 
@@ -27,7 +29,11 @@ def make_stars_filter(min_stars: int) -> Predicate:
         return int(stars) >= int(min_stars)
     return _ok
 
-def filter_hotels(items: Iterable[Any], preds: Sequence[Predicate]) -> Iterator[Any]:
+def filter_hotels(items: Iterable[Any], preds: Sequence[Predicate], limit: Optional[int] = None) -> Iterator[Any]:
+    if limit is not None:
+        yield from islice(filter_hotels(items, preds), limit)
+        return
+
     if not preds:
         for h in items:
             yield h
@@ -73,3 +79,47 @@ def _make_rateplan_filter(required_keys: List[str]):
         return True
 
     return pred
+
+
+@dataclass(frozen=True)
+class HotelSearch:
+    """Выбор фильтров на странице поиска."""
+    city: Optional[str] = None
+    min_price: int = 0
+    max_price: Optional[int] = None
+    min_stars: int = 1
+    room_types: Tuple[str, ...] = ()
+    room_types_all: bool = False
+    extras: Tuple[str, ...] = ()
+    extras_all: bool = False
+
+
+def plan_hotel_search(s: HotelSearch) -> Tuple[Dict[str, Any], List[Predicate]]:
+    """Превращает выбор фильтров в (kwargs для tools.db.fetch_hotels, остаточные предикаты).
+
+    В SQL уходят индексируемые условия, которые отбирают надмножество ответа; остаточные
+    предикаты (те же make_*_filter) досчитывают точную семантику на уже отобранных строках:
+    int(price) <= max_price и округление рейтинга до звёзд.
+    """
+    sql: Dict[str, Any] = {}
+    preds: List[Predicate] = []
+
+    if s.city and s.city not in ("Все", "All"):
+        sql["city"] = s.city
+
+    if s.min_price:
+        sql["min_price"] = s.min_price
+    if s.max_price is not None:
+        sql["max_price"] = s.max_price + 1  # int(price) <= max  <=>  price < max + 1
+        preds.append(make_price_range_filter(s.min_price, s.max_price))
+
+    if s.min_stars > 1:
+        sql["min_rating"] = s.min_stars - 0.5  # round(rating) >= stars  =>  rating >= stars - 0.5
+        preds.append(make_stars_filter(s.min_stars))
+
+    if s.room_types:
+        sql["all_types" if s.room_types_all else "any_types"] = list(s.room_types)
+    if s.extras:
+        sql["all_plans" if s.extras_all else "any_plans"] = list(s.extras)
+
+    return sql, preds
@@ -1,7 +1,11 @@
 from __future__ import annotations
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
-from typing import Dict, Iterable
-from core.domain import Price, Availability, RatePlan, RoomType, Hotel
+from itertools import repeat
+from typing import Collection, Dict, Iterable, Optional
+from core.domain import Price, Availability, RatePlan, RoomType, Hotel, PriceBatch, AvailabilityBatch
+from core.dates import iso_to_ordinal
 
 def index_prices_by_rate_date(prices: Iterable[Price]) -> Dict[tuple[int, str], int]:
     # (rate_id, 'YYYY-MM-DD') -> amount
@@ -17,6 +21,129 @@ def index_avail_by_rt_date(avails: Iterable[Availability]) -> Dict[tuple[int, st
         idx[(a.room_type_id, a.date)] = a.available
     return idx
 
+def day_of(x: Price | Availability) -> int:
+    """Порядковый номер дня записи: из поля day, иначе из ISO-даты."""
+    return x.day if x.day is not None else iso_to_ordinal(x.date)
+
+def _days(records) -> Iterable[int]:
+    if isinstance(records, (PriceBatch, AvailabilityBatch)):
+        return records.days
+    return (day_of(x) for x in records)
+
+def index_prices_by_rate_day(prices: Iterable[Price]) -> Dict[tuple[int, int], int]:
+    # (rate_id, day ordinal) -> amount
+    return {(p.rate_id, day_of(p)): p.amount for p in prices}
+
+def index_avail_by_rt_day(avails: Iterable[Availability]) -> Dict[tuple[int, int], int]:
+    # (room_type_id, day ordinal) -> available
+    return {(a.room_type_id, day_of(a)): a.available for a in avails}
+
+MISSING = -1  # нет записи за день (в т.ч. цена/остаток вне горизонта)
+
+class DenseInventory:
+    """Плотные вектора на горизонте дней [start, end): цена по rate_id, остаток по room_type_id.
+
+    Один array('q') на тариф и на тип номера, ячейка дня — индекс day - start,
+    пустые дни — MISSING. Поиск — арифметика индекса вместо кортежа-ключа и словаря.
+    Записи вне горизонта пропускаются; при дублях дня побеждает последняя (как в dict-индексах),
+    а с min_prices=True для цен — минимальная (как в окне lazy_offers).
+    """
+    __slots__ = ("start", "end", "prices", "avails", "_blank")
+
+    def __init__(
+        self,
+        prices: Iterable[Price] | PriceBatch,
+        avails: Iterable[Availability] | AvailabilityBatch,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        min_prices: bool = False,
+        rate_ids: Optional[Collection[int]] = None,
+        room_type_ids: Optional[Collection[int]] = None,
+    ):
+        """rate_ids/room_type_ids — строить вектора только этих тарифов/типов номеров:
+        остальные записи отбрасываются до разбора даты (календарь и котировка читают одну пару)."""
+        if rate_ids is not None and not isinstance(prices, PriceBatch):
+            prices = [p for p in prices if p.rate_id in rate_ids]
+        if room_type_ids is not None and not isinstance(avails, AvailabilityBatch):
+            avails = [a for a in avails if a.room_type_id in room_type_ids]
+        if start is None or end is None:
+            if not isinstance(prices, (PriceBatch, list, tuple)):
+                prices = tuple(prices)
+            if not isinstance(avails, (AvailabilityBatch, list, tuple)):
+                avails = tuple(avails)
+            days = [*_days(prices), *_days(avails)]
+            start = min(days, default=0) if start is None else start
+            end = max(days, default=start - 1) + 1 if end is None else end
+        self.start: int = start
+        self.end: int = max(start, end)
+        self._blank = array("q", [MISSING]) * (self.end - self.start)
+        # колоночные батчи отдают столбцы напрямую, без объекта на строку
+        if isinstance(prices, PriceBatch):
+            price_items = zip(prices.rate_ids, prices.days, repeat(None), prices.amounts)
+            if rate_ids is not None:
+                price_items = (item for item in price_items if item[0] in rate_ids)
+        else:
+            price_items = ((p.rate_id, p.day, p.date, p.amount) for p in prices)
+        if isinstance(avails, AvailabilityBatch):
+            avail_items = zip(avails.room_type_ids, avails.days, repeat(None), avails.available)
+            if room_type_ids is not None:
+                avail_items = (item for item in avail_items if item[0] in room_type_ids)
+        else:
+            avail_items = ((a.room_type_id, a.day, a.date, a.available) for a in avails)
+        self.prices: Dict[int, array] = self._vectors(price_items, keep_min=min_prices)
+        self.avails: Dict[int, array] = self._vectors(avail_items)
+
+    @classmethod
+    def from_price_columns(
+        cls, rate_ids: Iterable[int], days: Iterable[int], amounts: Iterable[int],
+        start: int, end: int, min_prices: bool = False,
+    ) -> "DenseInventory":
+        """Только цены, из параллельных столбцов (например, срезов PriceBatch) на горизонте [start, end)."""
+        inv = cls((), (), start, end)
+        inv.prices = inv._vectors(zip(rate_ids, days, repeat(None), amounts), keep_min=min_prices)
+        return inv
+
+    def _vectors(self, items: Iterable[tuple[int, Optional[int], str, int]], keep_min: bool = False) -> Dict[int, array]:
+        start, size, blank = self.start, self.end - self.start, self._blank
+        out: Dict[int, array] = {}
+        for key, day, iso, value in items:
+            i = (day if day is not None else iso_to_ordinal(iso)) - start
+            if 0 <= i < size:
+                vec = out.get(key)
+                if vec is None:
+                    vec = out[key] = array("q", blank)
+                elif keep_min and MISSING != vec[i] <= value:
+                    continue
+                vec[i] = value
+        return out
+
+    def price_vector(self, rate_id: int) -> array:
+        """Вектор цен тарифа по дням горизонта (индекс — day - start).
+
+        Для тарифа без цен — общий вектор из MISSING: только для чтения.
+        """
+        return self.prices.get(rate_id, self._blank)
+
+    def avail_vector(self, room_type_id: int) -> array:
+        """Вектор остатков типа номера по дням горизонта; MISSING — записи нет."""
+        return self.avails.get(room_type_id, self._blank)
+
+    def price(self, rate_id: int, day: int) -> Optional[int]:
+        """Цена за день или None."""
+        vec = self.prices.get(rate_id)
+        i = day - self.start
+        if vec is None or not 0 <= i < len(vec) or vec[i] == MISSING:
+            return None
+        return vec[i]
+
+    def available(self, room_type_id: int, day: int) -> int:
+        """Остаток за день (0 — нет записи)."""
+        vec = self.avails.get(room_type_id)
+        i = day - self.start
+        if vec is None or not 0 <= i < len(vec):
+            return 0
+        return max(vec[i], 0)
+
 def index_rates_by_id(rates: Iterable[RatePlan]) -> Dict[int, RatePlan]:
     return {r.id: r for r in rates}
 
@@ -33,3 +160,45 @@ def index_prices_by_rate(prices: Iterable[Price]) -> Dict[int, list[Price]]:
     for rid in d:
         d[rid].sort(key=lambda x: x.date)
     return d
+
+class PriceSeries:
+    """Цены одного тарифа: параллельные массивы дней (ordinal) и сумм, по возрастанию дня.
+
+    Запросы по полуинтервалу дней [start, end) находят границы bisect-ом:
+    O(log n + k) вместо прохода по всей истории цен. Дубли дня сохраняются.
+    """
+    __slots__ = ("days", "amounts")
+
+    def __init__(self, prices: Iterable[Price] | PriceBatch):
+        if isinstance(prices, PriceBatch):
+            pairs = sorted(zip(prices.days, prices.amounts))
+        else:
+            pairs = sorted((day_of(p), p.amount) for p in prices)
+        self.days = array("q", [d for d, _ in pairs])
+        self.amounts = array("q", [a for _, a in pairs])
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def _bounds(self, start: int, end: int) -> tuple[int, int]:
+        lo = bisect_left(self.days, start)
+        return lo, max(lo, bisect_left(self.days, end, lo))
+
+    def slice(self, start: int, end: int) -> tuple[array, array]:
+        """(дни, суммы) за [start, end)."""
+        lo, hi = self._bounds(start, end)
+        return self.days[lo:hi], self.amounts[lo:hi]
+
+    def min_in(self, start: int, end: int) -> Optional[int]:
+        lo, hi = self._bounds(start, end)
+        return min(self.amounts[lo:hi], default=None)
+
+    def sum_in(self, start: int, end: int) -> int:
+        lo, hi = self._bounds(start, end)
+        return sum(self.amounts[lo:hi])
+
+def index_price_series_by_rate(prices: Iterable[Price]) -> Dict[int, PriceSeries]:
+    by_rate: Dict[int, list[Price]] = defaultdict(list)
+    for p in prices:
+        by_rate[p.rate_id].append(p)
+    return {rid: PriceSeries(items) for rid, items in by_rate.items()}
@@ -1,59 +1,444 @@
 from __future__ import annotations
-from typing import Iterable, Iterator, Callable, Dict, Any, Optional, Tuple
-from datetime import date, timedelta
+import heapq
+from array import array
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import compress
+from typing import Iterable, Iterator, Callable, Dict, Any, Mapping, NamedTuple, Optional, Tuple, Union
+from datetime import date
 
-from core.domain import Hotel, RoomType, RatePlan, Price, Availability, Rule
-from core.dates import to_date, to_iso, daterange
+from core.domain import Hotel, RoomType, RatePlan, Price, Availability, PriceBatch, WindowMins
+from core.dates import to_date, ordinal_to_iso, iso_to_ordinal
 from core.indexes import (
     index_hotels_by_id, index_roomtypes_by_id, index_rates_by_id,
-    index_prices_by_rate, index_avail_by_rt_date, index_prices_by_rate_date,
+    DenseInventory, MISSING, PriceSeries,
 )
-from core.rules import get_min_stay, get_max_stay, is_cta_date, is_ctd_date
+from core.rules import RulesLike, compile_rules, get_min_stay, get_max_stay, is_cta_date, is_ctd_date
 
 def iter_available_days(avail: Iterable[Availability], room_type_id: int) -> Iterator[tuple[str, int]]:
     for a in sorted(avail, key=lambda x: x.date):
         if a.room_type_id == room_type_id and a.available > 0:
             yield (a.date, a.available)
 
-def lazy_offers(
+Offer = tuple[Hotel, RoomType, RatePlan, int]
+PricesLike = Union[Iterable[Price], Mapping[int, PriceSeries]]
+
+# Ключи top-K режима lazy_offers: meta -> значение, меньше — лучше.
+OFFER_SORT_KEYS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "price": lambda m: m["min_price_in_window"],
+    "min_price_in_window": lambda m: m["min_price_in_window"],
+    "stars": lambda m: (-m["hotel_stars"], m["min_price_in_window"]),
+}
+
+def _window_inventory(prices: Iterable[Price], avails: Iterable[Availability], lookahead_days: int) -> DenseInventory:
+    """Плотные вектора окна [сегодня, +lookahead_days); при дублях дня — минимальная цена."""
+    first = date.today().toordinal()
+    return DenseInventory(prices, avails, first, first + max(lookahead_days, 0), min_prices=True)
+
+def _availability_mask(avail_vec: array) -> bytes:
+    """Маска окна типа номера: 1 — на день есть остаток."""
+    return bytes(left > 0 for left in avail_vec)
+
+def _window_best(price_vec: array, mask: bytes) -> Optional[int]:
+    """Минимальная цена по дням маски (дни без цены пропускаются) или None."""
+    return min(filter(MISSING.__ne__, compress(price_vec, mask)), default=None)
+
+def _series_window_best(series: PriceSeries, start: int, mask: bytes) -> Optional[int]:
+    """Минимальная цена серии по дням маски окна [start, start + len(mask)) или None."""
+    days, amounts = series.slice(start, start + len(mask))
+    return min((amount for d, amount in zip(days, amounts) if mask[d - start]), default=None)
+
+def _window_offers(
     hotels: Iterable[Hotel],
     room_types: Iterable[RoomType],
     rates: Iterable[RatePlan],
-    prices: Iterable[Price],
+    prices: PricesLike,
     avails: Iterable[Availability],
-    predicate: Callable[[Dict[str, Any]], bool],
-    lookahead_days: int = 60,
-) -> Iterator[tuple[Hotel, RoomType, RatePlan, int]]:
+    lookahead_days: int,
+) -> Iterator[tuple[Dict[str, Any], Offer]]:
+    """(meta, offer) для каждого тарифа с ценой и остатком в окне — в порядке rates.
+
+    Окно и остатки — целочисленно индексированные вектора и маски по дням горизонта;
+    лучшая цена тарифа — минимум по маске его типа номера (маска строится раз на тип).
+    Если prices — готовые PriceSeries по rate_id, окно тарифа берётся bisect-срезом.
+    """
     H = index_hotels_by_id(hotels)
     RT = index_roomtypes_by_id(room_types)
-    P_by_rate = index_prices_by_rate(prices)
-    A = index_avail_by_rt_date(avails)
-
-    today = date.today()
-    window = {to_iso(today + timedelta(days=i)) for i in range(lookahead_days)}
+    series = prices if isinstance(prices, Mapping) else None
+    inv = _window_inventory(() if series is not None else prices, avails, lookahead_days)
+    masks: Dict[int, bytes] = {}
 
     for rp in rates:
         h = H.get(rp.hotel_id)
         rt = RT.get(rp.room_type_id)
-        if not h or not rt:
+        prices_of_rate = series.get(rp.id) if series is not None else inv.prices.get(rp.id)
+        if not h or not rt or prices_of_rate is None:
             continue
 
-        best: Optional[int] = None
-        for p in P_by_rate.get(rp.id, []):
-            if p.date in window and A.get((rt.id, p.date), 0) > 0:
-                best = p.amount if best is None else min(best, p.amount)
-
+        mask = masks.get(rt.id)
+        if mask is None:
+            mask = masks[rt.id] = _availability_mask(inv.avail_vector(rt.id))
+        if series is not None:
+            best = _series_window_best(prices_of_rate, inv.start, mask)
+        else:
+            best = _window_best(prices_of_rate, mask)
         if best is None:
             continue
 
-        meta = {
-            "hotel_id": h.id, "hotel_stars": h.stars, "hotel_city": h.city,
-            "room_type_id": rt.id, "rate_id": rp.id,
-            "meal": rp.meal, "refundable": rp.refundable,
-            "min_price_in_window": best,
-        }
-        if predicate(meta):
-            yield (h, rt, rp, best)
+        yield _offer_meta(h, rt, rp, best), (h, rt, rp, best)
+
+def _materialized_offers(
+    hotels: Iterable[Hotel],
+    room_types: Iterable[RoomType],
+    rates: Iterable[RatePlan],
+    window_mins: WindowMins,
+) -> Iterator[tuple[Dict[str, Any], Offer]]:
+    """Как _window_offers, но лучшая цена берётся готовой (tools.db.fetch_rate_window_mins)."""
+    H = index_hotels_by_id(hotels)
+    RT = index_roomtypes_by_id(room_types)
+    for rp in rates:
+        h = H.get(rp.hotel_id)
+        rt = RT.get(rp.room_type_id)
+        best = window_mins.get(rp.id)
+        if h and rt and best is not None:
+            yield _offer_meta(h, rt, rp, best), (h, rt, rp, best)
+
+def _offer_meta(h: Hotel, rt: RoomType, rp: RatePlan, best: int) -> Dict[str, Any]:
+    return {
+        "hotel_id": h.id, "hotel_stars": h.stars, "hotel_city": h.city,
+        "room_type_id": rt.id, "rate_id": rp.id,
+        "meal": rp.meal, "refundable": rp.refundable,
+        "min_price_in_window": best,
+    }
+
+# Задание шарда: горизонт окна [start, end), срез столбцов цен (rate_id, day, amount),
+# типы номеров каждого тарифа и маски остатков по room_type_id.
+Shard = tuple[int, int, tuple[array, array, array], Dict[int, tuple[int, ...]], Dict[int, bytes]]
+
+def _best_prices_shard(shard: Shard) -> Dict[tuple[int, int], int]:
+    """Воркер пула: {(rate_id, room_type_id): лучшая цена} по строкам цен своего среза.
+
+    Вектора окна строит сам воркер — O(цен) проход идёт параллельно, а не в родителе.
+    """
+    start, end, columns, rate_rts, masks = shard
+    inv = DenseInventory.from_price_columns(*columns, start, end, min_prices=True)
+    out = {}
+    for rate_id, vec in inv.prices.items():
+        for rt_id in rate_rts.get(rate_id, ()):
+            best = _window_best(vec, masks[rt_id])
+            if best is not None:
+                out[rate_id, rt_id] = best
+    return out
+
+def _price_columns(prices: Iterable[Price] | PriceBatch) -> tuple[array, array, array]:
+    """Столбцы (rate_id, day, amount): у PriceBatch готовые, иначе — по проходу на столбец."""
+    if isinstance(prices, PriceBatch):
+        return prices.rate_ids, prices.days, prices.amounts
+    if not isinstance(prices, (list, tuple)):
+        prices = list(prices)
+    return (
+        array("q", [p.rate_id for p in prices]),
+        array("q", [p.day if p.day is not None else iso_to_ordinal(p.date) for p in prices]),
+        array("q", [p.amount for p in prices]),
+    )
+
+# Общие пулы lazy_offers по числу воркеров: процессы стартуют один раз на процесс приложения.
+_offer_pools: Dict[int, ProcessPoolExecutor] = {}
+_offer_pools_lock = threading.Lock()
+
+def _offer_pool(workers: int) -> ProcessPoolExecutor:
+    """Пул на workers процессов; forkserver/spawn, а не fork — процесс Streamlit
+    многопоточный и держит открытые соединения SQLite."""
+    with _offer_pools_lock:
+        pool = _offer_pools.get(workers)
+        if pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            pool = _offer_pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(method),
+            )
+        return pool
+
+def _sharded_window_offers(
+    hotels: Iterable[Hotel],
+    room_types: Iterable[RoomType],
+    rates: Iterable[RatePlan],
+    prices: Iterable[Price] | PriceBatch,
+    avails: Iterable[Availability],
+    lookahead_days: int,
+    workers: int,
+    executor: Optional[Executor] = None,
+    shards_per_worker: int = 4,
+) -> Iterator[tuple[Dict[str, Any], Offer]]:
+    """То же, что _window_offers, но вектора цен и минимумы окна считаются в пуле процессов.
+
+    Родитель только раскладывает цены по столбцам (у PriceBatch они готовы) и режет их
+    на непрерывные диапазоны строк; каждый воркер строит вектора окна своего диапазона
+    и возвращает минимумы по тарифам. Цены тарифа могут попасть в разные шарды —
+    родитель берёт минимум из минимумов и отдаёт предложения в порядке rates.
+    """
+    H = index_hotels_by_id(hotels)
+    RT = index_roomtypes_by_id(room_types)
+    jobs = []
+    for rp in rates:
+        h = H.get(rp.hotel_id)
+        rt = RT.get(rp.room_type_id)
+        if h and rt:
+            jobs.append((h, rt, rp))
+    columns = _price_columns(prices)
+    total = len(columns[0])
+    if not jobs or not total:
+        return
+
+    # остатки малы (тип номера x день) — маски строятся в родителе
+    avail_inv = _window_inventory((), avails, lookahead_days)
+    start, end = avail_inv.start, avail_inv.end
+    rate_rts: Dict[int, tuple[int, ...]] = {}
+    for _, rt, rp in jobs:
+        rate_rts[rp.id] = (*rate_rts.get(rp.id, ()), rt.id)
+    masks = {rt_id: _availability_mask(avail_inv.avail_vector(rt_id))
+             for rt_id in {rt.id for _, rt, _ in jobs}}
+
+    pool = executor or _offer_pool(workers)
+    parts = -(-total // max(1, workers * shards_per_worker))
+    shards: list[Shard] = []
+    for lo in range(0, total, parts):
+        piece = tuple(col[lo:lo + parts] for col in columns)
+        # шарду — только метаданные тарифов своего среза, а не общие словари целиком
+        rts = {rid: rate_rts[rid] for rid in set(piece[0]) if rid in rate_rts}
+        shard_masks = {rt_id: masks[rt_id] for ids in rts.values() for rt_id in ids}
+        shards.append((start, end, piece, rts, shard_masks))
+    best: Dict[tuple[int, int], int] = {}
+    try:
+        for part in pool.map(_best_prices_shard, shards):
+            for key, amount in part.items():
+                if key not in best or amount < best[key]:
+                    best[key] = amount
+    except BrokenProcessPool:
+        with _offer_pools_lock:
+            if _offer_pools.get(workers) is pool:
+                del _offer_pools[workers]
+        raise
+
+    for h, rt, rp in jobs:
+        amount = best.get((rp.id, rt.id))
+        if amount is not None:
+            yield _offer_meta(h, rt, rp, amount), (h, rt, rp, amount)
+
+def lazy_offers(
+    hotels: Iterable[Hotel],
+    room_types: Iterable[RoomType],
+    rates: Iterable[RatePlan],
+    prices: PricesLike,
+    avails: Iterable[Availability],
+    predicate: Callable[[Dict[str, Any]], bool],
+    lookahead_days: int = 60,
+    top_k: Optional[int] = None,
+    sort_key: str = "price",
+    workers: Optional[int] = None,
+    window_mins: Optional[WindowMins] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[Offer]:
+    """Предложения, прошедшие predicate, лениво и в порядке rates.
+
+    top_k — вместо всего потока только top_k лучших по sort_key (см. OFFER_SORT_KEYS),
+    от лучшего к худшему; при равенстве — в порядке rates. Один проход по тарифам,
+    в памяти — куча из top_k элементов.
+    workers > 1 — вектора и минимумы окна считаются шардами в общем пуле процессов
+    (или в переданном executor); predicate (может быть lambda) выполняется в текущем
+    процессе, результат тот же. Родителю дешевле всего prices в виде PriceBatch.
+    window_mins — готовые минимумы окна (fetch_rate_window_mins(lookahead_days)); окно
+    минимумов должно совпадать с lookahead_days. Если они покрывают все тарифы с их типами
+    номеров, prices/avails не сканируются; иначе (например, тарифов нет в rate_plans)
+    предложения считаются сканом prices/avails.
+    prices можно передать готовым index_price_series_by_rate(...) (переиспользуется между
+    вызовами): окно тарифа — O(log n + k); шардирование при этом не нужно и не применяется.
+    """
+    if top_k is not None and sort_key not in OFFER_SORT_KEYS:
+        raise ValueError(f"unknown sort_key: {sort_key!r}")
+    if window_mins is not None and getattr(window_mins, "window_days", None) != lookahead_days:
+        raise ValueError(
+            f"window_mins cover {getattr(window_mins, 'window_days', None)!r} days, lookahead_days={lookahead_days!r}"
+        )
+
+    if window_mins is not None:
+        rates = list(rates)
+    if window_mins is not None and all(window_mins.covers(rp.id, rp.room_type_id) for rp in rates):
+        window = _materialized_offers(hotels, room_types, rates, window_mins)
+    elif (executor is not None or (workers or 1) > 1) and not isinstance(prices, Mapping):
+        window = _sharded_window_offers(hotels, room_types, rates, prices, avails, lookahead_days,
+                                        workers or os.cpu_count() or 1, executor)
+    else:
+        window = _window_offers(hotels, room_types, rates, prices, avails, lookahead_days)
+    matching = ((meta, offer) for meta, offer in window if predicate(meta))
+    if top_k is None:
+        return (offer for _, offer in matching)
+
+    key = OFFER_SORT_KEYS[sort_key]
+    return iter([offer for _, offer in heapq.nsmallest(top_k, matching, key=lambda mo: key(mo[0]))])
+
+
+class StayQuoter:
+    """Котировки проживаний по одной паре (rate_id, room_type_id) на горизонте DenseInventory.
+
+    Префиксные суммы по дням горизонта: сумма цен, число дней без цены и число
+    дней с ценой, но без остатка. Итог и ok любого проживания — O(1); список problems
+    по дням собирается проходом только для проживаний, где такие дни есть.
+    Дни вне горизонта считаются днями без цены.
+    """
+    __slots__ = ("rate_id", "room_type_id", "rules", "start", "end", "min_stay", "max_stay",
+                 "_prices", "_avails", "_sum", "_missing", "_soldout")
+
+    def __init__(self, rate_id: int, room_type_id: int, inventory: DenseInventory, rules: RulesLike):
+        self.rate_id = rate_id
+        self.room_type_id = room_type_id
+        self.rules = compile_rules(rules)
+        self.start, self.end = inventory.start, inventory.end
+        self.min_stay = get_min_stay(self.rules, room_type_id, rate_id)
+        self.max_stay = get_max_stay(self.rules, room_type_id, rate_id)
+
+        self._prices = inventory.price_vector(rate_id)
+        self._avails = inventory.avail_vector(room_type_id)
+        size = self.end - self.start
+        self._sum = array("q", bytes(8 * (size + 1)))
+        self._missing = array("q", self._sum)
+        self._soldout = array("q", self._sum)
+        total = missing = soldout = 0
+        for i in range(size):
+            amount = self._prices[i]
+            if amount == MISSING:
+                missing += 1
+            else:
+                total += amount
+                if self._avails[i] <= 0:
+                    soldout += 1
+            self._sum[i + 1] = total
+            self._missing[i + 1] = missing
+            self._soldout[i + 1] = soldout
+
+    def quote(self, checkin_iso: str, checkout_iso: str) -> tuple[int, bool, list[str]]:
+        """То же, что quote_offer для этой пары."""
+        d1 = to_date(checkin_iso).toordinal()
+        d2 = to_date(checkout_iso).toordinal()
+        nights = max(0, d2 - d1)
+        room_type_id, rate_id = self.room_type_id, self.rate_id
+
+        problems: list[str] = []
+        if nights < self.min_stay:
+            problems.append(f"min_stay {self.min_stay}")
+        if nights > self.max_stay:
+            problems.append(f"max_stay {self.max_stay}")
+
+        if is_cta_date(self.rules, room_type_id, rate_id, checkin_iso):
+            problems.append("CTA (запрет заезда)")
+        if is_ctd_date(self.rules, room_type_id, rate_id, checkout_iso):
+            problems.append("CTD (запрет выезда)")
+
+        lo = min(max(d1, self.start), self.end) - self.start
+        hi = max(min(d2, self.end), self.start) - self.start
+        if lo >= hi:
+            total, missing, soldout = 0, nights, 0
+        else:
+            total = self._sum[hi] - self._sum[lo]
+            missing = self._missing[hi] - self._missing[lo] + nights - (hi - lo)
+            soldout = self._soldout[hi] - self._soldout[lo]
+
+        if missing or soldout:
+            problems.extend(self._day_problems(d1, d2))
+
+        return total, not problems, problems
+
+    def clean_total(self, d1: int, d2: int) -> Optional[int]:
+        """Сумма за ночи [d1, d2) в порядковых днях, если у всех есть цена и остаток; иначе None.
+
+        Правила не проверяются. d1 < d2, обе границы внутри горизонта.
+        """
+        lo, hi = d1 - self.start, d2 - self.start
+        if self._missing[hi] - self._missing[lo] or self._soldout[hi] - self._soldout[lo]:
+            return None
+        return self._sum[hi] - self._sum[lo]
+
+    def _day_problems(self, d1: int, d2: int) -> Iterator[str]:
+        for d in range(d1, d2):
+            i = d - self.start
+            if not 0 <= i < len(self._prices) or self._prices[i] == MISSING:
+                yield f"Нет цены на {ordinal_to_iso(d)}"
+            elif self._avails[i] <= 0:
+                yield f"Нет доступности на {ordinal_to_iso(d)}"
+
+
+class StayOption(NamedTuple):
+    checkin: str
+    checkout: str
+    total: int
+
+
+def find_stays(
+    rate_id: int,
+    room_type_id: int,
+    nights: int,
+    window_start_iso: str,
+    window_days: int,
+    prices: Iterable[Price],
+    avails: Iterable[Availability],
+    rules: RulesLike,
+    limit: Optional[int] = None,
+) -> list[StayOption]:
+    """Все допустимые проживания на nights ночей внутри окна [window_start, +window_days).
+
+    Допустимое — то, для которого quote_offer вернул бы ok: цена и остаток на каждую ночь,
+    min_stay <= nights <= max_stay, нет CTA на заезд и CTD на выезд. Результат отсортирован
+    по (total, checkin); limit — только limit самых дешёвых.
+    Проход по окну линейный: сумма и проверки каждой даты заезда — O(1) по префиксам StayQuoter.
+    """
+    first = to_date(window_start_iso).toordinal()
+    end = first + max(window_days, 0)
+    rules = compile_rules(rules)
+    inv = DenseInventory(prices, avails, first, end, rate_ids=(rate_id,), room_type_ids=(room_type_id,))
+    quoter = StayQuoter(rate_id, room_type_id, inv, rules)
+    if nights < 1 or not quoter.min_stay <= nights <= quoter.max_stay:
+        return []
+
+    options: list[StayOption] = []
+    for d1 in range(first, end - nights + 1):
+        total = quoter.clean_total(d1, d1 + nights)
+        if total is None:
+            continue
+        checkin, checkout = ordinal_to_iso(d1), ordinal_to_iso(d1 + nights)
+        if is_cta_date(rules, room_type_id, rate_id, checkin) or is_ctd_date(rules, room_type_id, rate_id, checkout):
+            continue
+        options.append(StayOption(checkin, checkout, total))
+
+    key = lambda o: (o.total, o.checkin)
+    if limit is not None:
+        return heapq.nsmallest(limit, options, key=key)
+    return sorted(options, key=key)
+
+
+def quote_offers(
+    rate_id: int,
+    room_type_id: int,
+    stays: Iterable[tuple[str, str]],
+    prices: Iterable[Price],
+    avails: Iterable[Availability],
+    rules: RulesLike,
+) -> list[tuple[int, bool, list[str]]]:
+    """Пакетный quote_offer: много (checkin_iso, checkout_iso) по одному тарифу.
+
+    Индексы и префиксные суммы строятся один раз на общий горизонт всех проживаний.
+    """
+    stays = list(stays)
+    if not stays:
+        return []
+    bounds = [(to_date(cin).toordinal(), to_date(cout).toordinal()) for cin, cout in stays]
+    start = min(d1 for d1, _ in bounds)
+    end = max(max(d2 for _, d2 in bounds), start)
+    inv = DenseInventory(prices, avails, start, end, rate_ids=(rate_id,), room_type_ids=(room_type_id,))
+    quoter = StayQuoter(rate_id, room_type_id, inv, rules)
+    return [quoter.quote(cin, cout) for cin, cout in stays]
+
 
 def quote_offer(
     rate_id: int,
@@ -62,41 +447,6 @@ def quote_offer(
     checkout_iso: str,
     prices: Iterable[Price],
     avails: Iterable[Availability],
-    rules: Iterable[Rule],
+    rules: RulesLike,
 ) -> tuple[int, bool, list[str]]:
-    p_idx = index_prices_by_rate_date(prices)
-    a_idx = index_avail_by_rt_date(avails)
-
-    d1 = to_date(checkin_iso)
-    d2 = to_date(checkout_iso)
-    days = list(daterange(d1, d2))
-    nights = len(days)
-
-    problems: list[str] = []
-
-    min_stay = get_min_stay(rules, room_type_id, rate_id)
-    max_stay = get_max_stay(rules, room_type_id, rate_id)
-    if nights < min_stay:
-        problems.append(f"min_stay {min_stay}")
-    if nights > max_stay:
-        problems.append(f"max_stay {max_stay}")
-
-    if is_cta_date(rules, room_type_id, rate_id, checkin_iso):
-        problems.append("CTA (запрет заезда)")
-    if is_ctd_date(rules, room_type_id, rate_id, checkout_iso):
-        problems.append("CTD (запрет выезда)")
-
-    total = 0
-    for d in days:
-        iso = to_iso(d)
-        amount = p_idx.get((rate_id, iso))
-        if amount is None:
-            problems.append(f"Нет цены на {iso}")
-            continue
-        total += amount
-
-        if a_idx.get((room_type_id, iso), 0) <= 0:
-            problems.append(f"Нет доступности на {iso}")
-
-    ok = len(problems) == 0
-    return total, ok, problems
+    return quote_offers(rate_id, room_type_id, [(checkin_iso, checkout_iso)], prices, avails, rules)[0]
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Iterable
+from typing import Dict, Iterable, Optional, Tuple, Union
 from core.domain import Rule
 
 # ожидаемый payload:
@@ -13,38 +13,106 @@ def _match(payload: dict, **conds) -> bool:
             return False
     return True
 
-def get_min_stay(rules: Iterable[Rule], room_type_id: int, rate_id: int) -> int:
+def _stay_value(r: Rule, default: int) -> Optional[int]:
+    try:
+        return int(r.payload.get("value", default))
+    except Exception:
+        return None
+
+def _flag_value(r: Rule) -> bool:
+    return bool(r.payload.get("value", True))
+
+
+class CompiledRules:
+    """Правила, один раз разложенные по ключу (room_type_id, rate_id) из payload.
+
+    min/max stay — готовое число на ключ, CTA/CTD — словарь дата -> флаг первого
+    подходящего правила. Запросы с конкретными room_type_id/rate_id/датой стоят O(1);
+    запросы с None (совпадение «с любым») идут старым линейным проходом по self.rules.
+    """
+    __slots__ = ("rules", "_min_stay", "_max_stay", "_cta", "_ctd")
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules: Tuple[Rule, ...] = tuple(rules)
+        self._min_stay: Dict[tuple, int] = {}
+        self._max_stay: Dict[tuple, int] = {}
+        self._cta: Dict[tuple, Dict[str, bool]] = {}
+        self._ctd: Dict[tuple, Dict[str, bool]] = {}
+
+        for r in self.rules:
+            key = (r.payload.get("room_type_id"), r.payload.get("rate_id"))
+            if r.kind == "min_stay":
+                val = _stay_value(r, 1)
+                if val is not None:
+                    self._min_stay[key] = max(self._min_stay.get(key, 1), val)
+            elif r.kind == "max_stay":
+                val = _stay_value(r, 365)
+                if val is not None:
+                    self._max_stay[key] = min(self._max_stay.get(key, 365), val)
+            elif r.kind in ("cta", "ctd"):
+                by_date = (self._cta if r.kind == "cta" else self._ctd).setdefault(key, {})
+                by_date.setdefault(r.payload.get("date"), _flag_value(r))
+
+    def min_stay(self, room_type_id: int, rate_id: int) -> int:
+        if room_type_id is None or rate_id is None:
+            return get_min_stay(self.rules, room_type_id, rate_id)
+        return self._min_stay.get((room_type_id, rate_id), 1)
+
+    def max_stay(self, room_type_id: int, rate_id: int) -> int:
+        if room_type_id is None or rate_id is None:
+            return get_max_stay(self.rules, room_type_id, rate_id)
+        return self._max_stay.get((room_type_id, rate_id), 365)
+
+    def is_cta(self, room_type_id: int, rate_id: int, iso_date: str) -> bool:
+        if room_type_id is None or rate_id is None or iso_date is None:
+            return is_cta_date(self.rules, room_type_id, rate_id, iso_date)
+        return self._cta.get((room_type_id, rate_id), {}).get(iso_date, False)
+
+    def is_ctd(self, room_type_id: int, rate_id: int, iso_date: str) -> bool:
+        if room_type_id is None or rate_id is None or iso_date is None:
+            return is_ctd_date(self.rules, room_type_id, rate_id, iso_date)
+        return self._ctd.get((room_type_id, rate_id), {}).get(iso_date, False)
+
+
+RulesLike = Union[Iterable[Rule], CompiledRules]
+
+def compile_rules(rules: RulesLike) -> CompiledRules:
+    return rules if isinstance(rules, CompiledRules) else CompiledRules(rules)
+
+def get_min_stay(rules: RulesLike, room_type_id: int, rate_id: int) -> int:
+    if isinstance(rules, CompiledRules):
+        return rules.min_stay(room_type_id, rate_id)
     best = 1
     for r in rules:
         if r.kind == "min_stay" and _match(r.payload, room_type_id=room_type_id, rate_id=rate_id):
-            try:
-                val = int(r.payload.get("value", 1))
-                if val > best:
-                    best = val
-            except Exception:
-                pass
+            val = _stay_value(r, 1)
+            if val is not None and val > best:
+                best = val
     return best
 
-def get_max_stay(rules: Iterable[Rule], room_type_id: int, rate_id: int) -> int:
+def get_max_stay(rules: RulesLike, room_type_id: int, rate_id: int) -> int:
+    if isinstance(rules, CompiledRules):
+        return rules.max_stay(room_type_id, rate_id)
     best = 365
     for r in rules:
         if r.kind == "max_stay" and _match(r.payload, room_type_id=room_type_id, rate_id=rate_id):
-            try:
-                val = int(r.payload.get("value", 365))
-                if val < best:
-                    best = val
-            except Exception:
-                pass
+            val = _stay_value(r, 365)
+            if val is not None and val < best:
+                best = val
     return best
 
-def is_cta_date(rules: Iterable[Rule], room_type_id: int, rate_id: int, iso_date: str) -> bool:
+def is_cta_date(rules: RulesLike, room_type_id: int, rate_id: int, iso_date: str) -> bool:
+    if isinstance(rules, CompiledRules):
+        return rules.is_cta(room_type_id, rate_id, iso_date)
     for r in rules:
         if r.kind == "cta" and _match(r.payload, room_type_id=room_type_id, rate_id=rate_id, date=iso_date):
-            return bool(r.payload.get("value", True))
+            return _flag_value(r)
     return False
 
-def is_ctd_date(rules: Iterable[Rule], room_type_id: int, rate_id: int, iso_date: str) -> bool:
+def is_ctd_date(rules: RulesLike, room_type_id: int, rate_id: int, iso_date: str) -> bool:
+    if isinstance(rules, CompiledRules):
+        return rules.is_ctd(room_type_id, rate_id, iso_date)
     for r in rules:
         if r.kind == "ctd" and _match(r.payload, room_type_id=room_type_id, rate_id=rate_id, date=iso_date):
-            return bool(r.payload.get("value", True))
+            return _flag_value(r)
     return False
@@ -1,28 +1,21 @@
 # pages/search_page.py
-import json
 import time
 import asyncio
 from pathlib import Path
 from datetime import date, timedelta
 from urllib.parse import urlencode
-from itertools import islice, chain
 
 import streamlit as st
 
-from tools.db import fetch_hotels
-from core.filtres import (
-    make_city_filter,
-    make_price_range_filter,
-    make_stars_filter,
-    filter_hotels,
-)
-from core.calendar import build_price_calendar
-from core.domain import Price, Availability, Rule
+from tools.db import fetch_hotels, fetch_hotel_cities, fetch_max_hotel_price, hotel_cursor
+from tools.utils import parse_list_field, norm_token
+from core.filtres import HotelSearch, plan_hotel_search, filter_hotels
+from core.calendar import calendar_cache, build_price_calendar, DayCell
 
+from core.dates import month_grid_bounds
 from tools.db import (
-    ensure_calendar_tables,
-    fetch_prices_for_calendar,
-    fetch_availability_for_calendar,
+    calendar_data_versions,
+    fetch_calendar_batch,
     fetch_rules_for_rate,
 )
 
@@ -108,55 +101,19 @@ ROOMTYPE_FIXED = [
 ]
 EXTRAS = ["Breakfast", "Lunch", "Dinner", "Bar", "Drinks", "SPA", "Pool", "Wi-Fi", "Parking"]
 
-
-# --- Утилиты ------------------------------------------------------------------
-def _parse_list_field(raw) -> list[str]:
-    """Принимает CSV/JSON/список/строку и возвращает список строк."""
-    if raw is None:
-        return []
-    if isinstance(raw, list):
-        return [str(x).strip() for x in raw if str(x).strip()]
-    if isinstance(raw, str):
-        s = raw.strip()
-        if not s:
-            return []
-        try:
-            v = json.loads(s)
-            if isinstance(v, list):
-                return [str(x).strip() for x in v if str(x).strip()]
-            if isinstance(v, dict):
-                return [str(k).strip() for k in v.keys() if str(k).strip()]
-        except Exception:
-            pass
-        return [t.strip() for t in s.split(",") if t.strip()]
-    return [str(raw).strip()] if str(raw).strip() else []
-
-
-def _norm(s: str) -> str:
-    return "".join(ch for ch in s.lower() if ch.isalnum())
-
-
-def _make_name_presence_filter(list_key: str, selected: list[str], require_all: bool):
-    """Фильтр по наличию имён (нормализованных) в поле списка (roomtype_list/rateplan_list).
-    Реализовано через множества нормализованных токенов: для All — подмножество, для Any — пересечение.
-    """
-    pats = {_norm(x) for x in (selected or []) if x and str(x).strip()}
-
-    def pred(h: dict) -> bool:
-        if not pats:
-            return True
-        vals_raw = h.get(list_key, []) or []
-        vals = {_norm(x) for x in vals_raw if x and str(x).strip()}
-        if not vals:
-            return False
-        if require_all:
-            return pats.issubset(vals)
-        else:
-            return bool(pats & vals)
-
-    return pred
+# подпись -> (order_by для fetch_hotels, descending)
+SORT_OPTIONS = {
+    "Default": ("id", False),
+    "Price ↑": ("price", False),
+    "Price ↓": ("price", True),
+    "Rating ↓": ("rating", True),
+    "Name": ("name", False),
+}
+PAGE_SIZES = [10, 20, 50]
+DEFAULT_PAGE_SIZE = 20
 
 
+# --- Утилиты ------------------------------------------------------------------
 def load_css(path: str):
     try:
         css = Path(path).read_text(encoding="utf-8")
@@ -183,14 +140,66 @@ def _qp_first(v):
     return v
 
 
-def _load_calendar_data(
-    hotel_id: int, room_type_id: int, rate_id: int, month_start: date
-) -> tuple[tuple[Price, ...], tuple[Availability, ...], tuple[Rule, ...]]:
-    ensure_calendar_tables()
-    prices = fetch_prices_for_calendar(rate_id, month_start)
-    avails = fetch_availability_for_calendar(room_type_id, month_start)
-    rules = fetch_rules_for_rate(room_type_id, rate_id)
-    return prices, avails, rules
+def _calendar_rate(h: dict) -> tuple[int, int]:
+    # TODO: замените на выбранные room_type_id/rate_id
+    return 1, 1
+
+
+def _load_calendar_grids(
+    keys: list[tuple[int, int, int]], month_start: date
+) -> dict[tuple[int, int, int], list[list[DayCell]]]:
+    """(hotel_id, room_type_id, rate_id) -> сетка для всех открытых календарей разом.
+
+    Сетки берутся из calendar_cache по версиям данных пары (тариф, тип номера);
+    из БД одним пакетом догружаются только промахи.
+    """
+    if not keys:
+        return {}
+    versions = calendar_data_versions((rt, rp) for _, rt, rp in keys)
+    grids: dict[tuple[int, int], list[list[DayCell]]] = {}
+    misses = []
+    for pair, version in versions.items():
+        grid = calendar_cache.get(calendar_cache.key(*pair, month_start, version))
+        if grid is None:
+            misses.append(pair)
+        else:
+            grids[pair] = grid
+
+    if misses:
+        grid_start, grid_end = month_grid_bounds(month_start)
+        data = fetch_calendar_batch(misses, grid_start, grid_end, columnar=True)
+        for rt, rp in misses:
+            prices, avails = data[(rt, rp)]
+            grid = build_price_calendar(rt, rp, month_start, prices, avails, fetch_rules_for_rate(rt, rp))
+            key = calendar_cache.key(rt, rp, month_start, versions[(rt, rp)])
+            grids[(rt, rp)] = calendar_cache.put(key, grid)
+
+    return {(hid, rt, rp): grids[(rt, rp)] for hid, rt, rp in keys}
+
+
+def _hotel_item(r) -> dict:
+    # r: id, name, city, price, rating, rooms, available, roomtype, rateplan, owner_id
+    return {
+        "id": int(r[0]),
+        "name": r[1],
+        "city": r[2],
+        "price": int(r[3]) if r[3] is not None else None,
+        "rating": float(r[4]) if r[4] is not None else 0.0,
+        "rooms": int(r[5]) if r[5] is not None else 0,
+        "available": bool(r[6]),
+        "roomtype_list": parse_list_field(r[7]),  # типы номеров
+        "rateplan_list": parse_list_field(r[8]),  # доп. услуги
+    }
+
+
+def _fetch_page(sql_filters: dict, residual, order_by: str, descending: bool, after, page_size: int):
+    """Одна страница выдачи: (отели, курсор следующей страницы или None, если это последняя)."""
+    rows = fetch_hotels(
+        **sql_filters, order_by=order_by, descending=descending, after=after, limit=page_size
+    ) or []
+    page = list(filter_hotels((_hotel_item(r) for r in rows), residual, limit=page_size))
+    next_cursor = hotel_cursor(rows[-1], order_by) if len(rows) == page_size else None
+    return page, next_cursor
 
 
 # --- Рендер страницы ----------------------------------------------------------
@@ -198,18 +207,16 @@ def render(goto):
     st.title("Search Hotels")
     load_css("assets/app.css")
 
-    # rows: id, name, city, price, rating, rooms, available, roomtype, rateplan, owner_id
-    rows = fetch_hotels() or []
-
     # базовые фильтры
     st.markdown('<div class="filters-header">⚙️ Filters</div>', unsafe_allow_html=True)
-    cities = sorted({str(r[2]) for r in rows if r[2]}) if rows else []
+    cities = fetch_hotel_cities()
     city = st.selectbox("🏙️ City", ["All"] + cities)
     
     if city == "All":
         city = None
 
-    max_price_in_data = max((int(r[3]) for r in rows if r[3] is not None), default=100000)
+    max_price_in_db = fetch_max_hotel_price()
+    max_price_in_data = int(max_price_in_db) if max_price_in_db is not None else 100000
     slider_max = max(10000, ((max_price_in_data // 10000) + 1) * 10000)
 
     colA, colB = st.columns(2)
@@ -252,220 +259,261 @@ def render(goto):
         flags = {}
         for idx, name in enumerate(EXTRAS):
             with (c1 if idx % 3 == 0 else c2 if idx % 3 == 1 else c3):
-                flags[name] = st.checkbox(name, key=f"rp_{_norm(name)}")
+                flags[name] = st.checkbox(name, key=f"rp_{norm_token(name)}")
         rp_mode = st.radio("More Services", ["Any", "All"], horizontal=True, key="rp_mode")
         selected_extras = [name for name, f in flags.items() if f]
 
-    # --- Подготовка данных для списка ---
-    items = []
-    for r in rows:
-        roomtype_list = _parse_list_field(r[7])  # типы номеров
-        rateplan_list = _parse_list_field(r[8])  # доп. услуги
-        items.append(
-            {
-                "id": int(r[0]),
-                "name": r[1],
-                "city": r[2],
-                "price": int(r[3]) if r[3] is not None else None,
-                "rating": float(r[4]) if r[4] is not None else 0.0,
-                "rooms": int(r[5]) if r[5] is not None else 0,
-                "available": bool(r[6]),
-                "roomtype_list": roomtype_list,
-                "rateplan_list": rateplan_list,
-            }
+    # --- Запрос: фильтры уходят в SQL, в Python — только точная досверка ---
+    sql_filters, residual = plan_hotel_search(
+        HotelSearch(
+            city=city,
+            max_price=max_price,
+            min_stars=min_stars,
+            room_types=tuple(selected_roomtypes),
+            room_types_all=(rt_mode == "All"),
+            extras=tuple(selected_extras),
+            extras_all=(rp_mode == "All"),
         )
+    )
+    # --- Сортировка и размер страницы ---
+    col_sort, col_size = st.columns(2)
+    with col_sort:
+        sort_label = st.selectbox("Sort by", list(SORT_OPTIONS), key="search_sort")
+    with col_size:
+        page_size = st.selectbox("Results per page", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key="search_page_size")
+    order_by, descending = SORT_OPTIONS[sort_label]
+
+    # Курсоры загруженных страниц (keyset): сбрасываются при смене фильтров/сортировки.
+    ss = st.session_state
+    signature = repr((sorted(sql_filters.items()), order_by, descending, page_size))
+    if ss.get("search_signature") != signature:
+        ss.search_signature = signature
+        ss.search_cursors = [None]
 
-    preds = [
-        make_city_filter(city),
-        make_price_range_filter(0, max_price),
-        make_stars_filter(min_stars),
-        _make_name_presence_filter(
-            "roomtype_list", selected_roomtypes, require_all=(rt_mode == "All")
-        ),
-        _make_name_presence_filter(
-            "rateplan_list", selected_extras, require_all=(rp_mode == "All")
-        ),
-    ]
-    filtered_iter = filter_hotels(items, preds)
-    first_chunk = list(islice(filtered_iter, 1))
-    if not first_chunk:
+    # --- Список результатов ---
+    hotels = []
+    next_cursor = None
+    for cursor in ss.search_cursors:
+        page, next_cursor = _fetch_page(sql_filters, residual, order_by, descending, cursor, page_size)
+        hotels.extend(page)
+        if next_cursor is None:
+            break
+
+    if not hotels and next_cursor is None:
         st.info("No hotels found matching your criteria.")
         return
 
-    filtered = chain(first_chunk, filtered_iter)
+    # данные всех открытых календарей — одним пакетом запросов
+    month_start = date.today().replace(day=1)
+    open_keys = [
+        (h["id"], *_calendar_rate(h)) for h in hotels if _calendar_is_open(h["id"], *_calendar_rate(h))
+    ]
+    calendars = _load_calendar_grids(open_keys, month_start)
+
+    for h in hotels:
+        _render_hotel(h, goto, calendars, month_start)
 
-    # --- Список результатов ---
-    for h in filtered:
-        stars = max(1, min(5, int(round(h["rating"]))))
-        with st.expander(f"{h['name']} — {h['city']} ⭐ {stars}", expanded=False):
-            st.write(f"**Price to this night:** {_fmt_money(h['price'])}")
-            st.write(f"**Rating:** {h['rating']:.1f}")
-            st.write(f"**Total Rooms:** {h['rooms']}")
-            st.write(f"**Available Now:** {'✅ Yes' if h['available'] else '❌ No'}")
-            if h.get("roomtype_list"):
-                st.write("**Room Types:** " + ", ".join(sorted(set(h["roomtype_list"]))))
-
-            if h.get("rateplan_list"):
-                st.write("**More Services:** " + ", ".join(sorted(set(h["rateplan_list"]))))
-
-            if st.button("Book Now", key=f"book_{h['id']}"):
-                if not st.session_state.get("user"):
-                    st.error("Please log in first.")
-                else:
-
-                    st.session_state.selected_hotel_id = h["id"]
-                    goto("booking")  # маршрут в нижнем регистре
-                    bus.subscribe("user_registered", registration_success_message)
-
-            # --- Календарь цен для этого отеля ---
-            with st.expander("📅 Show price calendar", expanded=False):
-                # TODO: замените на выбранные room_type_id/rate_id
-                room_type_id = 1
-                rate_id = 1
-
-                month_start = date.today().replace(day=1)
-                prices, avails, rules = _load_calendar_data(h["id"], room_type_id, rate_id, month_start)
-                grid = build_price_calendar(room_type_id, rate_id, month_start, prices, avails, rules)
-
-                # ==== namespace для состояния этого конкретного календаря ====
-                cal_id = f"h{h['id']}_rt{room_type_id}_rp{rate_id}"
-                # берём СНИМОК текущих query params (для построения href)
-                qp = dict(st.query_params)
-                pick_key = f"pick_{cal_id}"
-                cin_key = f"cin_{cal_id}"
-                cout_key = f"cout_{cal_id}"
-
-                # Инициализация из URL
-                if cin_key not in st.session_state and qp.get(cin_key) is not None:
-                    st.session_state[cin_key] = _qp_first(qp.get(cin_key))
-                if cout_key not in st.session_state and qp.get(cout_key) is not None:
-                    st.session_state[cout_key] = _qp_first(qp.get(cout_key))
-
-                cin = st.session_state.get(cin_key)
-                cout = st.session_state.get(cout_key)
-                pick = _qp_first(qp.get(pick_key))
-
-                # Клик по дню через query param (?pick_<cal_id>=YYYY-MM-DD)
-                if pick:
-                    if cin and cout:
-                        cin, cout = pick, None
-                    elif not cin:
-                        cin, cout = pick, None
-                    else:
-                        if pick == cin:
-                            cin, cout = None, None
-                        elif _iso_cmp(pick, cin) < 0:
-                            cin, cout = pick, None
-                        else:
-                            cout = pick
-
-                    st.session_state[cin_key], st.session_state[cout_key] = cin, cout
-
-                    # очищаем pick и обновляем cin/cout через st.query_params
-                    # (модификация объекта приводит к обновлению URL)
-                    if pick_key in st.query_params:
-                        del st.query_params[pick_key]
-                    if cin:
-                        st.query_params[cin_key] = cin
-                    else:
-                        st.query_params.pop(cin_key, None)
-                    if cout:
-                        st.query_params[cout_key] = cout
-                    else:
-                        st.query_params.pop(cout_key, None)
-
-                    st.rerun()
-
-                # Управляющие элементы
-                top_l, top_r = st.columns([1, 1])
-                with top_l:
-                    st.caption("Click 1 — **check-in**, click 2 — **check-out**. Click again on check-in to reset.")
-                with top_r:
-                    if st.button("Clear selection", key=f"clear_{cal_id}", use_container_width=True):
-                        st.session_state[cin_key] = None
-                        st.session_state[cout_key] = None
-                        # удаляем только ключи этого календаря
-                        st.query_params.pop(pick_key, None)
-                        st.query_params.pop(cin_key, None)
-                        st.query_params.pop(cout_key, None)
-                        st.rerun()
-
-                # Подготовим карты цен/доступности
-                price_by_day, avail_by_day = {}, {}
-                for week in grid:
-                    for c in week:
-                        price_by_day[c.d_iso] = c.amount
-                        avail_by_day[c.d_iso] = bool(getattr(c, "available", True))
-
-                # Сводка выбранного диапазона
-                if cin and cout and _iso_cmp(cout, cin) > 0:
-                    cin_d = date.fromisoformat(cin)
-                    cout_d = date.fromisoformat(cout)
-                    nights = (cout_d - cin_d).days
-
-                    total = 0
-                    ok = True
-                    d = cin_d
-                    while d < cout_d:
-                        d_iso = d.isoformat()
-                        if not avail_by_day.get(d_iso, False) or price_by_day.get(d_iso) is None:
-                            ok = False
-                        total += (price_by_day.get(d_iso) or 0)
-                        d = d + timedelta(days=1)
-
-                    msg = (
-                        f"**Check-in:** {cin}  ·  **Check-out:** {cout}  ·  "
-                        f"**Nights:** {nights}  ·  **Total:** {_fmt_money(total)}"
-                    )
-                    (st.success if ok else st.warning)(
-                        msg + ("" if ok else "  ·  ⚠️ There are unavailable/empty days in the range")
-                    )
-                    if ok and st.button("✅ Confirm dates", key=f"confirm_{cal_id}", type="primary", use_container_width=True):
-                        st.session_state[f"selected_range_{cal_id}"] = {
-                            "checkin": cin,
-                            "checkout": cout,
-                            "nights": nights,
-                            "total": total,
-                        }
-                        st.toast(f"Selected: {cin} → {cout} ({nights} nights)")
-
-                elif cin and not cout:
-                    st.info(f"Select a check-out date after {cin}")
-
-                # Рендер сетки
-                for week in grid:
-                    cols = st.columns(7)
-                    for i, cell in enumerate(week):
-                        day = cell.d_iso[-2:]
-                        price_str = _fmt_money(cell.amount)
-                        flags = " · ".join(getattr(cell, "flags", []) or [])
-                        avail = "✅" if getattr(cell, "available", True) else "❌"
-
-                        disabled = (cell.amount is None) or (not getattr(cell, "available", True))
-                        in_range = bool(
-                            cin and cout and _iso_cmp(cin, cell.d_iso) < 0 and _iso_cmp(cell.d_iso, cout) < 0
-                        )
-                        is_edge = (cin and cell.d_iso == cin) or (cout and cell.d_iso == cout)
-
-                        cls = []
-                        if disabled:
-                            cls.append("muted")
-                        if in_range:
-                            cls.append("in-range")
-                        if is_edge:
-                            cls.append("edge")
-
-                        # формируем ссылку с ДОБАВЛЕННЫМ pick, сохраняя остальные параметры
-                        href_params = dict(st.query_params)
-                        if not disabled:
-                            href_params[pick_key] = cell.d_iso
-                        href = "?" + urlencode(href_params, doseq=True) if not disabled else "#"
-
-                        html = f"""
-                        <div class="cal">
-                          <a class="{' '.join(cls)}" href="{href}">
-                            <b>{day}</b> {avail}<br><br>{price_str}{('<br><em>'+flags+'</em>') if flags else ''}
-                          </a>
-                        </div>
-                        """
-                        cols[i].markdown(html, unsafe_allow_html=True)
+    if next_cursor is not None:
+        if st.button("Load more", key="search_load_more", use_container_width=True):
+            ss.search_cursors.append(next_cursor)
+            st.rerun()
+
+
+def _render_hotel(h: dict, goto, calendars: dict, month_start: date):
+    stars = max(1, min(5, int(round(h["rating"]))))
+    with st.expander(f"{h['name']} — {h['city']} ⭐ {stars}", expanded=False):
+        st.write(f"**Price to this night:** {_fmt_money(h['price'])}")
+        st.write(f"**Rating:** {h['rating']:.1f}")
+        st.write(f"**Total Rooms:** {h['rooms']}")
+        st.write(f"**Available Now:** {'✅ Yes' if h['available'] else '❌ No'}")
+        if h.get("roomtype_list"):
+            st.write("**Room Types:** " + ", ".join(sorted(set(h["roomtype_list"]))))
+
+        if h.get("rateplan_list"):
+            st.write("**More Services:** " + ", ".join(sorted(set(h["rateplan_list"]))))
+
+        if st.button("Book Now", key=f"book_{h['id']}"):
+            if not st.session_state.get("user"):
+                st.error("Please log in first.")
+            else:
+
+                st.session_state.selected_hotel_id = h["id"]
+                goto("booking")  # маршрут в нижнем регистре
+                bus.subscribe("user_registered", registration_success_message)
+
+        # --- Календарь цен: данные грузятся только для открытого календаря ---
+        room_type_id, rate_id = _calendar_rate(h)
+        if _calendar_toggle(h["id"], room_type_id, rate_id):
+            key = (h["id"], room_type_id, rate_id)
+            grid = calendars.get(key) or _load_calendar_grids([key], month_start)[key]
+            _render_calendar(h["id"], room_type_id, rate_id, month_start, grid)
+
+
+def _calendar_id(hotel_id: int, room_type_id: int, rate_id: int) -> str:
+    return f"h{hotel_id}_rt{room_type_id}_rp{rate_id}"
+
+
+def _calendar_is_open(hotel_id: int, room_type_id: int, rate_id: int) -> bool:
+    """Явный флаг «календарь открыт» для отеля (тело st.expander выполняется и в свёрнутом виде).
+
+    Клик по дню — это переход по ссылке с ?pick_/cin_/cout_<cal_id>, новая сессия:
+    такой календарь считаем открытым.
+    """
+    cal_id = _calendar_id(hotel_id, room_type_id, rate_id)
+    open_key = f"cal_open_{cal_id}"
+    if open_key not in st.session_state:
+        qp = st.query_params
+        st.session_state[open_key] = any(f"{k}_{cal_id}" in qp for k in ("pick", "cin", "cout"))
+    return bool(st.session_state[open_key])
+
+
+def _calendar_toggle(hotel_id: int, room_type_id: int, rate_id: int) -> bool:
+    _calendar_is_open(hotel_id, room_type_id, rate_id)
+    open_key = f"cal_open_{_calendar_id(hotel_id, room_type_id, rate_id)}"
+    return st.toggle("📅 Show price calendar", key=open_key)
+
+
+def _render_calendar(hotel_id: int, room_type_id: int, rate_id: int, month_start: date, grid):
+
+    # ==== namespace для состояния этого конкретного календаря ====
+    cal_id = _calendar_id(hotel_id, room_type_id, rate_id)
+    # берём СНИМОК текущих query params (для построения href)
+    qp = dict(st.query_params)
+    pick_key = f"pick_{cal_id}"
+    cin_key = f"cin_{cal_id}"
+    cout_key = f"cout_{cal_id}"
+
+    # Инициализация из URL
+    if cin_key not in st.session_state and qp.get(cin_key) is not None:
+        st.session_state[cin_key] = _qp_first(qp.get(cin_key))
+    if cout_key not in st.session_state and qp.get(cout_key) is not None:
+        st.session_state[cout_key] = _qp_first(qp.get(cout_key))
+
+    cin = st.session_state.get(cin_key)
+    cout = st.session_state.get(cout_key)
+    pick = _qp_first(qp.get(pick_key))
+
+    # Клик по дню через query param (?pick_<cal_id>=YYYY-MM-DD)
+    if pick:
+        if cin and cout:
+            cin, cout = pick, None
+        elif not cin:
+            cin, cout = pick, None
+        else:
+            if pick == cin:
+                cin, cout = None, None
+            elif _iso_cmp(pick, cin) < 0:
+                cin, cout = pick, None
+            else:
+                cout = pick
+
+        st.session_state[cin_key], st.session_state[cout_key] = cin, cout
+
+        # очищаем pick и обновляем cin/cout через st.query_params
+        # (модификация объекта приводит к обновлению URL)
+        if pick_key in st.query_params:
+            del st.query_params[pick_key]
+        if cin:
+            st.query_params[cin_key] = cin
+        else:
+            st.query_params.pop(cin_key, None)
+        if cout:
+            st.query_params[cout_key] = cout
+        else:
+            st.query_params.pop(cout_key, None)
+
+        st.rerun()
+
+    # Управляющие элементы
+    top_l, top_r = st.columns([1, 1])
+    with top_l:
+        st.caption("Click 1 — **check-in**, click 2 — **check-out**. Click again on check-in to reset.")
+    with top_r:
+        if st.button("Clear selection", key=f"clear_{cal_id}", use_container_width=True):
+            st.session_state[cin_key] = None
+            st.session_state[cout_key] = None
+            # удаляем только ключи этого календаря
+            st.query_params.pop(pick_key, None)
+            st.query_params.pop(cin_key, None)
+            st.query_params.pop(cout_key, None)
+            st.rerun()
+
+    # Подготовим карты цен/доступности
+    price_by_day, avail_by_day = {}, {}
+    for week in grid:
+        for c in week:
+            price_by_day[c.d_iso] = c.amount
+            avail_by_day[c.d_iso] = bool(getattr(c, "available", True))
+
+    # Сводка выбранного диапазона
+    if cin and cout and _iso_cmp(cout, cin) > 0:
+        cin_d = date.fromisoformat(cin)
+        cout_d = date.fromisoformat(cout)
+        nights = (cout_d - cin_d).days
+
+        total = 0
+        ok = True
+        d = cin_d
+        while d < cout_d:
+            d_iso = d.isoformat()
+            if not avail_by_day.get(d_iso, False) or price_by_day.get(d_iso) is None:
+                ok = False
+            total += (price_by_day.get(d_iso) or 0)
+            d = d + timedelta(days=1)
+
+        msg = (
+            f"**Check-in:** {cin}  ·  **Check-out:** {cout}  ·  "
+            f"**Nights:** {nights}  ·  **Total:** {_fmt_money(total)}"
+        )
+        (st.success if ok else st.warning)(
+            msg + ("" if ok else "  ·  ⚠️ There are unavailable/empty days in the range")
+        )
+        if ok and st.button("✅ Confirm dates", key=f"confirm_{cal_id}", type="primary", use_container_width=True):
+            st.session_state[f"selected_range_{cal_id}"] = {
+                "checkin": cin,
+                "checkout": cout,
+                "nights": nights,
+                "total": total,
+            }
+            st.toast(f"Selected: {cin} → {cout} ({nights} nights)")
+
+    elif cin and not cout:
+        st.info(f"Select a check-out date after {cin}")
+
+    # Рендер сетки
+    for week in grid:
+        cols = st.columns(7)
+        for i, cell in enumerate(week):
+            day = cell.d_iso[-2:]
+            price_str = _fmt_money(cell.amount)
+            flags = " · ".join(getattr(cell, "flags", []) or [])
+            avail = "✅" if getattr(cell, "available", True) else "❌"
+
+            disabled = (cell.amount is None) or (not getattr(cell, "available", True))
+            in_range = bool(
+                cin and cout and _iso_cmp(cin, cell.d_iso) < 0 and _iso_cmp(cell.d_iso, cout) < 0
+            )
+            is_edge = (cin and cell.d_iso == cin) or (cout and cell.d_iso == cout)
+
+            cls = []
+            if disabled:
+                cls.append("muted")
+            if in_range:
+                cls.append("in-range")
+            if is_edge:
+                cls.append("edge")
+
+            # формируем ссылку с ДОБАВЛЕННЫМ pick, сохраняя остальные параметры
+            href_params = dict(st.query_params)
+            if not disabled:
+                href_params[pick_key] = cell.d_iso
+            href = "?" + urlencode(href_params, doseq=True) if not disabled else "#"
+
+            html = f"""
+            <div class="cal">
+              <a class="{' '.join(cls)}" href="{href}">
+                <b>{day}</b> {avail}<br><br>{price_str}{('<br><em>'+flags+'</em>') if flags else ''}
+              </a>
+            </div>
+            """
+            cols[i].markdown(html, unsafe_allow_html=True)
@@ -0,0 +1,25 @@
+import pytest
+
+from tools import db
+
+
+@pytest.fixture
+def empty_db(tmp_path, monkeypatch):
+    """Временная БД без init_db() — для тестов bootstrap и миграций."""
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    yield tmp_path
+    db.close_pool()
+
+
+@pytest.fixture
+def tmp_db(empty_db):
+    db.init_db()
+    return empty_db
+
+
+@pytest.fixture
+def seeded_db(tmp_db):
+    from tools.seed import load_seed
+
+    load_seed("Data/seed.json")
+    return tmp_db
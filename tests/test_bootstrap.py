@@ -0,0 +1,58 @@
+import json
+
+from tools import db, bootstrap
+
+
+def write_seed(path, hotel_name="Test Hotel"):
+    data = {
+        "hotels": [{"id": 1, "name": hotel_name, "city": "Almaty", "price": 1000, "rating": 4.0,
+                    "rooms": 10, "available": 5, "roomtype": ["Standard"], "rateplan": ["Wi-Fi"],
+                    "owner_id": 301}],
+        "users": [{"id": 1000, "username": "guest1", "email": "g@example.com",
+                   "password": "x", "role": "guest"}],
+    }
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def count_seed_calls(monkeypatch):
+    calls = []
+    original = db.seed_database
+
+    def wrapped(seed_path="Data/seed.json"):
+        calls.append(seed_path)
+        return original(seed_path)
+
+    monkeypatch.setattr(db, "seed_database", wrapped)
+    return calls
+
+
+def test_bootstrap_runs_once_per_process(empty_db, monkeypatch):
+    seed = write_seed(empty_db / "seed.json")
+    calls = count_seed_calls(monkeypatch)
+    assert bootstrap.bootstrap_database(seed) is True
+    assert bootstrap.bootstrap_database(seed) is False
+    assert len(calls) == 1
+    assert len(db.fetch_hotels()) == 1
+
+
+def test_bootstrap_skips_unchanged_seed_in_new_process(empty_db, monkeypatch):
+    seed = write_seed(empty_db / "seed.json")
+    bootstrap.bootstrap_database(seed)
+    bootstrap._done.clear()  # имитируем новый процесс
+    calls = count_seed_calls(monkeypatch)
+    bootstrap.bootstrap_database(seed)
+    assert calls == []
+
+
+def test_bootstrap_reseeds_when_seed_changes(empty_db, monkeypatch):
+    seed = write_seed(empty_db / "seed.json")
+    bootstrap.bootstrap_database(seed)
+    bootstrap._done.clear()
+    write_seed(empty_db / "seed.json", hotel_name="Other Hotel")
+    calls = count_seed_calls(monkeypatch)
+    bootstrap.bootstrap_database(seed)
+    assert len(calls) == 1
+    assert db.get_meta("schema_version") == str(db.SCHEMA_VERSION)
+    assert db.get_meta("seed_fingerprint") == bootstrap.seed_fingerprint(seed)
+    assert [h["name"] for h in db.fetch_hotels()] == ["Other Hotel"]
@@ -0,0 +1,35 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from core import dates
+
+
+def test_fast_codec_matches_strptime_strftime():
+    today = date.today()
+    days = [today + timedelta(days=i) for i in range(-800, 1600, 7)] + [date(1000, 1, 1), date(9999, 12, 31)]
+    for d in days:
+        iso = dates._strftime_iso(d)
+        assert dates.to_iso(d) == iso
+        assert dates.to_date(iso) == dates._strptime_date(iso) == d
+    assert dates.to_date("2025-1-5") == date(2025, 1, 5)
+    assert dates.to_iso(datetime(2025, 1, 5, 12, 30)) == "2025-01-05"
+
+
+@pytest.mark.parametrize("bad", ["2025-02-30", "2025-13-01", "20250101", "2025-W01-1", ""])
+def test_to_date_rejects_what_strptime_rejects(bad):
+    with pytest.raises(ValueError):
+        dates._strptime_date(bad)
+    with pytest.raises(ValueError):
+        dates.to_date(bad)
+
+
+def test_set_date_horizon_bounds_table():
+    saved = dates._iso_to_date, dates._date_to_iso
+    try:
+        dates.set_date_horizon(date(2030, 1, 1), date(2030, 1, 11))
+        assert len(dates._iso_to_date) == len(dates._date_to_iso) == 10
+        assert dates.to_date("2030-01-10") == date(2030, 1, 10)
+        assert dates.to_date("2030-01-11") == date(2030, 1, 11)
+    finally:
+        dates._iso_to_date, dates._date_to_iso = saved
@@ -0,0 +1,456 @@
+import threading
+import pytest
+
+from tools import db
+
+
+def test_pool_reuses_connections(tmp_db):
+    with db.get_connection() as c1:
+        pass
+    with db.get_connection() as c2:
+        pass
+    assert c1 is c2
+
+
+def test_pool_applies_pragmas(tmp_db):
+    with db.get_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_pool_rolls_back_on_error(tmp_db):
+    with pytest.raises(RuntimeError):
+        with db.get_connection() as conn:
+            conn.execute("INSERT INTO meta(key, value) VALUES ('k', 'v')")
+            raise RuntimeError("boom")
+    assert db.get_meta("k") is None
+
+
+def test_pool_is_thread_safe(tmp_db):
+    errors = []
+
+    def worker(i):
+        try:
+            for j in range(20):
+                db.set_meta(f"k{i}_{j}", str(j))
+                assert db.get_meta(f"k{i}_{j}") == str(j)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+def test_calendar_reads_run_no_ddl(tmp_db):
+    from datetime import date
+
+    statements = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        db.ensure_calendar_tables()
+        db.fetch_prices_for_calendar(1, date(2025, 11, 1))
+        db.fetch_availability_for_calendar(1, date(2025, 11, 1))
+        db.fetch_rules_for_rate(1, 1)
+    finally:
+        with db.get_connection() as conn:
+            conn.set_trace_callback(None)
+    assert statements
+    assert not [s for s in statements if s.lstrip().upper().startswith(("CREATE", "BEGIN", "COMMIT"))]
+
+
+def test_bulk_seed_loads_all_tables(tmp_db):
+    from tools.seed import load_seed
+
+    stats = {s.table: s for s in load_seed("Data/seed.json")}
+    assert stats["prices"].rows == 3000
+    assert stats["availability"].rows == 1500
+    assert all(s.rows_per_sec > 0 for s in stats.values())
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 3000
+        names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert set(db.INDEXES) <= names
+
+
+def test_bulk_seed_is_idempotent(tmp_db):
+    from tools.seed import load_seed
+
+    load_seed("Data/seed.json")
+    load_seed("Data/seed.json")
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM hotels").fetchone()[0] == 6
+        assert conn.execute("SELECT COUNT(*) FROM rules").fetchone()[0] == 45
+
+
+def test_streaming_seed_reports_progress(tmp_db):
+    from tools.seed import load_seed
+
+    progress = []
+    stats = {s.table: s for s in load_seed("Data/seed.json", report=progress.append, batch_size=500)}
+    price_steps = [p.rows for p in progress if p.table == "prices"]
+    assert price_steps == list(range(500, 3001, 500))
+    assert stats["prices"].rows == 3000
+
+
+def _ids(rows):
+    return sorted(int(r[0]) for r in rows)
+
+
+def test_fetch_hotels_token_filters_use_junction_tables(tmp_db):
+    from tools.seed import load_seed
+
+    load_seed("Data/seed.json")
+    # 1: VIP Deluxe, Standard, Standard Deluxe, Standard Plus; 2: VIP Plus, VIP Deluxe, Standard Plus
+    assert _ids(db.fetch_hotels(any_types=["VIP Plus"])) == [2, 4, 5]
+    assert _ids(db.fetch_hotels(all_types=["vip deluxe", "Standard"])) == [1, 4, 5]
+    assert _ids(db.fetch_hotels(all_plans=["Wi-Fi", "Parking"])) == _ids(
+        db.fetch_hotels(any_plans=["wifi"], all_plans=["PARKING"])
+    )
+
+
+def test_insert_and_delete_hotel_keep_tokens_in_sync(tmp_db):
+    import json
+
+    hid = db.insert_hotel(1, "New", "Almaty", 100, 4.0, 2, 1,
+                          json.dumps({"Standard": {"count": 1}}), json.dumps({"wifi": {"has": True}}))
+    assert _ids(db.fetch_hotels(any_types=["Standard"], any_plans=["Wi-Fi"])) == [hid]
+    assert db.delete_hotel_owned(hid, 1)
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM hotel_roomtypes").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM hotel_amenities").fetchone()[0] == 0
+
+
+def test_init_db_backfills_tokens_for_existing_hotels(tmp_db):
+    with db.get_connection() as conn:
+        conn.execute("""
+            INSERT INTO hotels (id, name, city, price, rating, rooms, available, roomtype, rateplan)
+            VALUES (1, 'Old', 'Almaty', 1, 1, 1, 1, 'Standard,VIP Plus', 'Bar')
+        """)
+        conn.execute("DELETE FROM hotel_roomtypes")
+    db.init_db()
+    assert _ids(db.fetch_hotels(all_types=["VIP Plus", "Standard"], any_plans=["bar"])) == [1]
+
+
+@pytest.mark.parametrize("order_by", db.HOTEL_SORT_KEYS)
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_pages_cover_full_ordering(seeded_db, order_by, descending):
+    with db.get_connection() as conn:
+        # дубли значений и NULL в ключах сортировки
+        conn.executemany("""
+            INSERT INTO hotels (name, city, price, rating, rooms, available, roomtype, rateplan)
+            VALUES (?, 'Almaty', ?, ?, 1, 1, 'Standard', '')
+        """, [("Twin", 100, 4.0), ("Twin", 100, 4.0), (None, None, None), (None, None, None)])
+
+    full = [r["id"] for r in db.fetch_hotels(order_by=order_by, descending=descending)]
+    paged, cursor = [], None
+    while True:
+        rows = db.fetch_hotels(order_by=order_by, descending=descending, after=cursor, limit=3)
+        paged += [r["id"] for r in rows]
+        if len(rows) < 3:
+            break
+        cursor = db.hotel_cursor(rows[-1], order_by)
+    assert paged == full
+    assert len(full) == 10
+
+
+def test_fetch_hotels_rejects_unknown_sort_key(tmp_db):
+    with pytest.raises(ValueError):
+        db.fetch_hotels(order_by="price; DROP TABLE hotels")
+
+
+def test_calendar_batch_matches_single_fetches(seeded_db):
+    from datetime import date
+    from core.dates import month_grid_bounds
+
+    month = date(2025, 12, 1)
+    start, end = month_grid_bounds(month)
+    pairs = [(1001, 2001), (1002, 2002), (1001, 2003), (999, 998)]
+    batch = db.fetch_calendar_batch(pairs, start, end)
+    assert set(batch) == set(pairs)
+    for rt, rp in pairs:
+        prices, avails = batch[(rt, rp)]
+        assert prices == db.fetch_prices_for_calendar(rp, month)
+        assert avails == db.fetch_availability_for_calendar(rt, month)
+    assert batch[(1001, 2001)][0] and batch[(999, 998)] == ((), ())
+
+
+def _rules_by_payload_scan(room_type_id, rate_id):
+    """Прежняя реализация fetch_rules_for_rate: полный скан + json.loads."""
+    import json
+
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT id, kind, payload FROM rules ORDER BY id").fetchall()
+    out = []
+    for r in rows:
+        payload = json.loads(r[2]) if r[2] else {}
+        if payload.get("room_type_id") not in (None, room_type_id):
+            continue
+        if payload.get("rate_id") not in (None, rate_id):
+            continue
+        out.append((int(r[0]), r[1], {k: v for k, v in payload.items() if v is not None}))
+    return out
+
+
+def test_rules_lookup_matches_payload_scan(seeded_db):
+    import json
+
+    seed = json.load(open("Data/seed.json", encoding="utf-8"))
+    pairs = {(r["payload"].get("room_type_id"), r["payload"].get("rate_id")) for r in seed["rules"]}
+    pairs |= {(1001, 2001), (12345, 54321)}
+    for rt, rp in pairs:
+        got = [(r.id, r.kind, r.payload) for r in db.fetch_rules_for_rate(rt, rp)]
+        assert got == _rules_by_payload_scan(rt, rp), (rt, rp)
+
+
+def test_rule_columns_migrated_from_payload(tmp_db):
+    with db.get_connection() as conn:
+        conn.execute("DROP TABLE rules")
+        conn.execute("CREATE TABLE rules (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL)")
+        conn.execute("""INSERT INTO rules VALUES (1, 'min_stay', '{"room_type_id": 5, "rate_id": 7, "value": 3}')""")
+    db._calendar_schema_ready.clear()
+    db.ensure_calendar_tables()
+    rules = db.fetch_rules_for_rate(5, 7)
+    assert [(r.kind, r.payload) for r in rules] == [("min_stay", {"room_type_id": 5, "rate_id": 7, "value": 3})]
+    assert db.fetch_rules_for_rate(5, 8) == ()
+
+
+def test_calendar_versions_follow_seeded_entities(tmp_db):
+    from tools.seed import bulk_load
+
+    assert db.calendar_data_versions([(1, 1), (2, 2)]) == {(1, 1): (0, 0, 0), (2, 2): (0, 0, 0)}
+    bulk_load({"prices": [{"id": 1, "rate_id": 1, "date": "2025-12-01", "amount": 100}]})
+    assert db.calendar_data_versions([(1, 1), (2, 2)]) == {(1, 1): (1, 0, 0), (2, 2): (0, 0, 0)}
+    bulk_load({"availability": [{"id": 1, "room_type_id": 2, "date": "2025-12-01", "available": 2}],
+               "rules": []})
+    assert db.calendar_data_versions([(1, 1), (2, 2)]) == {(1, 1): (1, 0, 2), (2, 2): (0, 2, 2)}
+
+
+def test_streamed_bulk_load_stamps_entities_per_batch(tmp_db):
+    from tools.seed import bulk_load
+
+    batches = [("prices", [{"id": i, "rate_id": i, "date": "2025-12-01", "amount": 100}]) for i in (1, 2, 3)]
+    bulk_load(iter(batches))
+    assert db.current_version() == 1
+    assert db.fetch_entity_versions("rates", [1, 2, 3]) == {1: 1, 2: 1, 3: 1}
+    assert db.fetch_table_versions(["prices"]) == {"prices": 1}
+    bulk_load(iter([("unknown", [{}])]))
+    assert db.current_version() == 1
+
+
+def test_writers_record_changes(tmp_db):
+    from tools.changes import ChangeFeed
+
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO users (id, username, email, password, role) VALUES (1, 'u', 'u@x', 'p', 'partner')")
+    feed = ChangeFeed()
+    seen = []
+    feed.subscribe(seen.append, tables=("bookings",))
+
+    hotel_id = db.insert_hotel(1, "H", "Almaty", 100, 4.0, 10, 1, "Single", "Wi-Fi")
+    changes = feed.poll()
+    assert changes.tables == {"hotels": changes.version}
+    assert changes.ids("hotels") == {hotel_id} and not seen
+
+    booking_id = db.insert_booking(1, hotel_id, "2025-12-01", "2025-12-03", 2)
+    changes = feed.poll()
+    assert set(changes.tables) == {"bookings"}
+    assert set(changes.entities) == {("bookings", booking_id), ("hotels", hotel_id), ("users", 1)}
+    assert seen == [changes]
+    assert not feed.poll()
+
+    assert db.delete_booking_owned(booking_id, owner_id=2) is False
+    assert not feed.poll()
+    assert db.delete_booking_owned(booking_id, owner_id=1) is True
+    assert feed.poll().ids("bookings") == {booking_id}
+
+    db.insert_booking(1, hotel_id, "2025-12-05", "2025-12-06", 1)
+    feed.poll()
+    assert db.delete_hotel_owned(hotel_id, owner_id=1) is True
+    changes = feed.poll()
+    assert set(changes.tables) == {"hotels", "bookings"}
+    assert changes.ids("hotels") == {hotel_id} and len(changes.ids("bookings")) == 1
+    assert db.fetch_entity_versions("hotels", [hotel_id, 999]) == {hotel_id: changes.version, 999: 0}
+
+
+def test_failed_write_does_not_record_changes(tmp_db):
+    version = db.current_version()
+    with pytest.raises(Exception):
+        db.insert_booking(12345, 67890, "2025-12-01", "2025-12-02", 1)
+    assert db.current_version() == version
+
+
+def test_calendar_cache_is_keyed_on_version():
+    from datetime import date
+    from core.calendar import CalendarCache
+
+    cache = CalendarCache(maxsize=2)
+    month = date(2025, 12, 1)
+    k1, k2, k3 = (cache.key(1, 1, month, (v, 0, 0)) for v in (1, 2, 3))
+    grid = cache.put(k1, [[]])
+    assert cache.get(k1) is grid
+    assert cache.get(k2) is None
+    cache.put(k2, [[]])
+    cache.get(k1)
+    cache.put(k3, [[]])
+    assert cache.get(k1) is grid and cache.get(k2) is None
+
+
+def test_seeded_day_matches_sqlite_ordinal(seeded_db):
+    from datetime import date
+
+    with db.get_connection() as conn:
+        for table in ("prices", "availability"):
+            rows = conn.execute(
+                f"SELECT date, day, {db.SQL_DAY_ORDINAL.format(col='date')} FROM {table}"
+            ).fetchall()
+            assert rows and all(day == date.fromisoformat(d).toordinal() == sql for d, day, sql in rows)
+
+
+def test_day_columns_migrated_from_text_dates(tmp_db):
+    from datetime import date
+
+    with db.get_connection() as conn:
+        conn.execute("DROP TABLE prices")
+        conn.execute("""CREATE TABLE prices (id INTEGER PRIMARY KEY, rate_id INTEGER NOT NULL,
+                        date TEXT NOT NULL, amount INTEGER NOT NULL, currency TEXT NOT NULL)""")
+        conn.execute("INSERT INTO prices VALUES (1, 7, '2025-12-31', 100, 'KZT')")
+        # v8–v9: day — обычная колонка, строка без day из неё выпадала
+        conn.execute("DROP TABLE availability")
+        conn.execute("""CREATE TABLE availability (id INTEGER PRIMARY KEY, room_type_id INTEGER NOT NULL,
+                        date TEXT NOT NULL, available INTEGER NOT NULL, day INTEGER)""")
+        conn.execute("CREATE INDEX idx_avail_rt_day ON availability(room_type_id, day)")
+        conn.execute("INSERT INTO availability (id, room_type_id, date, available) VALUES (1, 3, '2025-12-31', 2)")
+        conn.execute("INSERT INTO availability (id, room_type_id, date, available) VALUES (2, 3, '2025-12-x', 2)")
+    db._calendar_schema_ready.clear()
+    db.ensure_calendar_tables()
+    prices = db.fetch_prices_batch([7], date(2025, 12, 1), date(2026, 1, 1))[7]
+    assert [(p.date, p.day) for p in prices] == [("2025-12-31", date(2025, 12, 31).toordinal())]
+    avails = db.fetch_availability_batch([3], date(2025, 12, 1), date(2026, 1, 1))[3]
+    assert [(a.date, a.day) for a in avails] == [("2025-12-31", date(2025, 12, 31).toordinal())]
+
+
+def test_day_is_derived_from_date(tmp_db):
+    from datetime import date
+
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO prices (rate_id, date, amount, currency) VALUES (7, '2025-12-05', 100, 'KZT')")
+        conn.execute("UPDATE prices SET date = '2025-12-06' WHERE rate_id = 7")
+    prices = db.fetch_prices_batch([7], date(2025, 12, 1), date(2026, 1, 1))[7]
+    assert [(p.date, p.day) for p in prices] == [("2025-12-06", date(2025, 12, 6).toordinal())]
+
+
+@pytest.mark.parametrize("bad", ["2024-02-30", "2025-1-5", "2025-12-01T10:00", "soon"])
+def test_noncanonical_dates_rejected_on_write(tmp_db, bad):
+    import sqlite3
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.get_connection() as conn:
+            conn.execute("INSERT INTO prices (rate_id, date, amount, currency) VALUES (7, ?, 100, 'KZT')", (bad,))
+    with pytest.raises(sqlite3.IntegrityError):
+        db.upsert_availability(3, bad, 1)
+
+
+def _window_mins_by_scan(rates, prices, avails, start, days):
+    """Эталон: минимум цены тарифа с остатком > 0 в [start, start + days)."""
+    from datetime import timedelta
+
+    window = {(start + timedelta(days=i)).isoformat() for i in range(days)}
+    left = {(a["room_type_id"], a["date"]): a["available"] for a in avails}
+    out = {}
+    for rp in rates:
+        amounts = [p["amount"] for p in prices
+                   if p["rate_id"] == rp["id"] and p["date"] in window and left.get((rp["room_type_id"], p["date"]), 0) > 0]
+        out[rp["id"]] = min(amounts, default=None)
+    return out
+
+
+def test_rate_window_mins_incremental_and_shift(tmp_db):
+    import random
+    from datetime import date, timedelta
+    from tools.seed import bulk_load
+
+    rng = random.Random(5)
+    today = date.today()
+    rates = [{"id": 500 + i, "hotel_id": 1, "room_type_id": 70 + i % 3} for i in range(6)]
+    prices = [{"id": len(rates) * 1000 + k, "rate_id": rp["id"], "date": (today + timedelta(days=d)).isoformat(),
+               "amount": rng.randrange(100, 999)} for k, (rp, d) in enumerate((rp, d) for rp in rates for d in range(-3, 95))]
+    avails = [{"room_type_id": rt, "date": (today + timedelta(days=d)).isoformat(), "available": rng.choice((0, 1, 2))}
+              for rt in (70, 71, 72) for d in range(-3, 95)]
+    for i, a in enumerate(avails):
+        a["id"] = i + 1
+    bulk_load({"rate_plans": rates, "prices": prices, "availability": avails})
+
+    def check(start):
+        for w in db.WINDOW_SIZES:
+            assert db.fetch_rate_window_mins(w, today=start) == _window_mins_by_scan(rates, prices, avails, start, w), w
+
+    check(today)
+    assert db.fetch_rate_window_mins(30, today=today).window_days == 30
+
+    cheapest = min(prices, key=lambda p: p["amount"])
+    d5 = (today + timedelta(days=5)).isoformat()
+    db.upsert_price(501, d5, 1)
+    for p in prices:
+        if p["rate_id"] == 501 and p["date"] == d5:
+            p["amount"] = 1
+    db.upsert_availability(71, d5, 0)
+    db.upsert_availability(72, d5, 3)
+    for a in avails:
+        if a["room_type_id"] in (71, 72) and a["date"] == d5:
+            a["available"] = 0 if a["room_type_id"] == 71 else 3
+    db.upsert_price(cheapest["rate_id"], cheapest["date"], 10_000)
+    cheapest["amount"] = 10_000
+    check(today)
+
+    tomorrow = today + timedelta(days=1)
+    check(tomorrow)
+    assert db.shift_rate_window_mins(tomorrow) is False
+    with pytest.raises(ValueError):
+        db.fetch_rate_window_mins(14)
+
+
+def test_rate_window_mins_built_from_seeded_prices(seeded_db):
+    import json
+    from datetime import date, timedelta
+
+    seed = json.load(open("Data/seed.json", encoding="utf-8"))
+    start = date(2025, 11, 20)
+    window = {(start + timedelta(days=i)).isoformat() for i in range(60)}
+    expected = {}
+    for p in seed["prices"]:
+        if p["date"] in window:
+            expected[p["rate_id"]] = min(expected.get(p["rate_id"], p["amount"]), p["amount"])
+
+    mins = db.fetch_rate_window_mins(60, today=start)
+    assert expected and dict(mins) == expected
+    assert set(mins.room_types.values()) == {None}   # в сиде нет rate_plans
+
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM rate_window_mins")
+    assert db.fetch_rate_window_mins(60, today=start) == expected
+
+
+def test_columnar_calendar_batch_matches_rows(seeded_db):
+    from datetime import date
+    from core.calendar import build_price_calendar
+    from core.dates import month_grid_bounds
+    from core.domain import PriceBatch, AvailabilityBatch
+
+    month = date(2025, 12, 1)
+    start, end = month_grid_bounds(month)
+    pairs = [(1001, 2001), (1002, 2002), (999, 998)]
+    rows = db.fetch_calendar_batch(pairs, start, end)
+    cols = db.fetch_calendar_batch(pairs, start, end, columnar=True)
+    for pair in pairs:
+        (prices, avails), (pb, ab) = rows[pair], cols[pair]
+        assert isinstance(pb, PriceBatch) and isinstance(ab, AvailabilityBatch)
+        assert tuple(pb) == prices and tuple(ab) == avails
+        assert len(pb) == len(prices) and (not prices or pb[-1] == prices[-1])
+        assert tuple(pb[1:4]) == prices[1:4]
+        rules = db.fetch_rules_for_rate(*pair)
+        assert build_price_calendar(*pair, month, pb, ab, rules) == build_price_calendar(*pair, month, prices, avails, rules)
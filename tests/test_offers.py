@@ -0,0 +1,307 @@
+import json
+from dataclasses import replace
+from datetime import date, timedelta
+
+import pytest
+
+from core.domain import Price, Availability, Rule
+from core.offers import quote_offer
+
+
+def seed_data():
+    data = json.load(open("Data/seed.json", encoding="utf-8"))
+    prices = tuple(Price(p["id"], p["rate_id"], p["date"], p["amount"], p.get("currency", "KZT")) for p in data["prices"])
+    avails = tuple(Availability(a["id"], a["room_type_id"], a["date"], a["available"]) for a in data["availability"])
+    rules = tuple(Rule(r["id"], r["kind"], r["payload"]) for r in data["rules"])
+    return prices, avails, rules
+
+
+def with_days(items):
+    return tuple(replace(x, day=date.fromisoformat(x.date).toordinal()) for x in items)
+
+
+def test_quote_offer_same_with_and_without_day_ordinals():
+    prices, avails, rules = seed_data()
+    prices_d, avails_d = with_days(prices), with_days(avails)
+    cases = [
+        (2001, 1001, "2025-11-20", "2025-11-23"),
+        (2002, 1002, "2025-12-30", "2026-01-05"),
+        (2003, 1001, "2026-01-15", "2026-01-20"),   # выходит за горизонт цен
+        (2008, 1019, "2025-11-24", "2025-11-25"),   # CTA
+    ]
+    for rate_id, rt_id, cin, cout in cases:
+        plain = quote_offer(rate_id, rt_id, cin, cout, prices, avails, rules)
+        fast = quote_offer(rate_id, rt_id, cin, cout, prices_d, avails_d, rules)
+        assert plain == fast
+    total, ok, problems = quote_offer(2003, 1001, "2026-01-15", "2026-01-20", prices, avails, rules)
+    assert "Нет цены на 2026-01-19" in problems
+
+
+def test_dense_inventory_matches_dict_indexes():
+    from core.indexes import DenseInventory, index_prices_by_rate_day, index_avail_by_rt_day
+
+    prices, avails, _ = seed_data()
+    p_idx, a_idx = index_prices_by_rate_day(prices), index_avail_by_rt_day(avails)
+    inv = DenseInventory(prices, avails)
+    rate_ids = {p.rate_id for p in prices} | {999}
+    rt_ids = {a.room_type_id for a in avails} | {999}
+    for day in range(inv.start - 3, inv.end + 3):
+        for rid in rate_ids:
+            assert inv.price(rid, day) == p_idx.get((rid, day))
+        for rt in rt_ids:
+            assert inv.available(rt, day) == max(a_idx.get((rt, day), 0), 0)
+
+    window = DenseInventory(prices, avails, inv.start + 10, inv.start + 17)
+    assert {len(v) for v in window.prices.values()} == {7}
+    assert window.price(2001, inv.start + 9) is None
+    assert DenseInventory((), ()).price(2001, 1) is None
+
+    only = DenseInventory(prices, avails, inv.start, inv.end, rate_ids=(2001,), room_type_ids=(1001,))
+    assert set(only.prices) == {2001} and set(only.avails) == {1001}
+    assert only.price_vector(2001) == inv.price_vector(2001) and only.avail_vector(1001) == inv.avail_vector(1001)
+
+
+def _quote_by_nights(rate_id, rt_id, cin, cout, prices, avails, rules):
+    """Эталон: прежний пошаговый подсчёт по dict-индексам."""
+    from core.indexes import index_prices_by_rate_date, index_avail_by_rt_date
+    from core.rules import get_min_stay, get_max_stay, is_cta_date, is_ctd_date
+
+    p_idx, a_idx = index_prices_by_rate_date(prices), index_avail_by_rt_date(avails)
+    d1, d2 = date.fromisoformat(cin), date.fromisoformat(cout)
+    days = [d1 + timedelta(days=i) for i in range((d2 - d1).days)]
+    problems = []
+    min_stay, max_stay = get_min_stay(rules, rt_id, rate_id), get_max_stay(rules, rt_id, rate_id)
+    if len(days) < min_stay:
+        problems.append(f"min_stay {min_stay}")
+    if len(days) > max_stay:
+        problems.append(f"max_stay {max_stay}")
+    if is_cta_date(rules, rt_id, rate_id, cin):
+        problems.append("CTA (запрет заезда)")
+    if is_ctd_date(rules, rt_id, rate_id, cout):
+        problems.append("CTD (запрет выезда)")
+    total = 0
+    for d in days:
+        amount = p_idx.get((rate_id, d.isoformat()))
+        if amount is None:
+            problems.append(f"Нет цены на {d.isoformat()}")
+            continue
+        total += amount
+        if a_idx.get((rt_id, d.isoformat()), 0) <= 0:
+            problems.append(f"Нет доступности на {d.isoformat()}")
+    return total, not problems, problems
+
+
+def test_batch_quotes_match_night_by_night():
+    import random
+    from core.offers import quote_offers
+
+    prices, avails, rules = seed_data()
+    rng = random.Random(7)
+    base = date(2025, 11, 15)
+    pairs = {(r.payload.get("rate_id"), r.payload.get("room_type_id")) for r in rules} | {(2001, 1001), (2002, 1002)}
+    for rate_id, rt_id in sorted(pairs, key=str):
+        if rate_id is None or rt_id is None:
+            continue
+        stays = []
+        for _ in range(40):
+            cin = base + timedelta(days=rng.randrange(70))
+            stays.append((cin.isoformat(), (cin + timedelta(days=rng.randrange(-1, 12))).isoformat()))
+        got = quote_offers(rate_id, rt_id, stays, prices, avails, rules)
+        assert got == [_quote_by_nights(rate_id, rt_id, cin, cout, prices, avails, rules) for cin, cout in stays]
+    assert quote_offers(2001, 1001, [], prices, avails, rules) == []
+
+
+def test_find_stays_matches_quote_per_checkin():
+    from core.offers import find_stays, quote_offer
+
+    prices, avails, rules = seed_data()
+    rules = rules + (
+        Rule(90001, "cta", {"room_type_id": 1001, "rate_id": 2001, "date": "2025-11-25"}),
+        Rule(90002, "ctd", {"room_type_id": 1001, "rate_id": 2001, "date": "2025-12-01"}),
+        Rule(90003, "max_stay", {"room_type_id": 1001, "rate_id": 2001, "value": 5}),
+    )
+    start = date(2025, 11, 18)
+    for rate_id, rt_id in [(2001, 1001), (2002, 1002), (2008, 1019)]:
+        for nights in (1, 3, 6):
+            expected = []
+            for i in range(60 - nights + 1):
+                cin, cout = start + timedelta(days=i), start + timedelta(days=i + nights)
+                total, ok, _ = quote_offer(rate_id, rt_id, cin.isoformat(), cout.isoformat(), prices, avails, rules)
+                if ok:
+                    expected.append((cin.isoformat(), cout.isoformat(), total))
+            expected.sort(key=lambda o: (o[2], o[0]))
+            got = find_stays(rate_id, rt_id, nights, start.isoformat(), 60, prices, avails, rules)
+            assert [tuple(o) for o in got] == expected
+            assert find_stays(rate_id, rt_id, nights, start.isoformat(), 60, prices, avails, rules, limit=3) == got[:3]
+    assert find_stays(2001, 1001, 6, start.isoformat(), 60, prices, avails, rules) == []
+    assert "2025-11-25" not in {o.checkin for o in find_stays(2001, 1001, 2, start.isoformat(), 60, prices, avails, rules)}
+
+
+def offer_fixture(n_rates=30):
+    import random
+    from core.domain import Hotel, RoomType, RatePlan
+
+    rng = random.Random(3)
+    today = date.today()
+    hotels = [Hotel(h, f"H{h}", 1 + h % 5, "Almaty" if h % 2 else "Astana", ()) for h in range(1, 7)]
+    room_types = [RoomType(100 + h.id, h.id, "Std", 2, (), ()) for h in hotels]
+    rates = [RatePlan(1000 + i, 1 + i % 6, 101 + i % 6, f"R{i}", "BB", bool(i % 2), None) for i in range(n_rates)]
+    prices, avails = [], []
+    for rp in rates:
+        for i in range(-5, 80, 2):
+            d = (today + timedelta(days=i)).isoformat()
+            prices.append(Price(len(prices) + 1, rp.id, d, rng.randrange(100, 200) * 100, "KZT"))
+    for rt in room_types:
+        for i in range(-5, 80):
+            d = (today + timedelta(days=i)).isoformat()
+            avails.append(Availability(len(avails) + 1, rt.id, d, rng.choice((0, 1, 2))))
+    return hotels, room_types, rates, prices, avails
+
+
+def test_lazy_offers_top_k_matches_sorted_stream():
+    from core.offers import lazy_offers
+
+    data = offer_fixture()
+    everything = list(lazy_offers(*data, predicate=lambda m: True))
+    assert len(everything) == 30
+    cheap = sorted(everything, key=lambda o: o[3])
+    assert list(lazy_offers(*data, predicate=lambda m: True, top_k=5)) == cheap[:5]
+    assert list(lazy_offers(*data, predicate=lambda m: True, top_k=5, sort_key="min_price_in_window")) == cheap[:5]
+
+    by_stars = sorted(everything, key=lambda o: (-o[0].stars, o[3]))
+    assert list(lazy_offers(*data, predicate=lambda m: True, top_k=7, sort_key="stars")) == by_stars[:7]
+
+    refundable = [o for o in cheap if o[2].refundable]
+    assert list(lazy_offers(*data, predicate=lambda m: m["refundable"], top_k=100)) == refundable
+    with pytest.raises(ValueError):
+        lazy_offers(*data, predicate=lambda m: True, top_k=3, sort_key="nope")
+
+
+def test_sharded_offers_match_serial_stream():
+    from core.offers import lazy_offers
+
+    hotels, room_types, rates, prices, avails = offer_fixture(n_rates=60)
+    # дубль цены на день: в окне берётся минимальная
+    dup = prices[len(prices) // 2]
+    prices = prices + [replace(dup, id=10**6, amount=dup.amount - 1), replace(dup, id=10**6 + 1, amount=dup.amount + 1)]
+    data = (hotels, room_types, rates, prices, avails)
+
+    serial = list(lazy_offers(*data, predicate=lambda m: m["hotel_stars"] > 1))
+    assert serial
+    assert list(lazy_offers(*data, predicate=lambda m: m["hotel_stars"] > 1, workers=2)) == serial
+    assert (list(lazy_offers(*data, predicate=lambda m: True, workers=3, top_k=4, sort_key="stars"))
+            == list(lazy_offers(*data, predicate=lambda m: True, top_k=4, sort_key="stars")))
+
+
+def test_sharded_offers_reuse_pool_and_accept_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    from core.domain import PriceBatch
+    from core.offers import _offer_pool, lazy_offers
+
+    hotels, room_types, rates, prices, avails = offer_fixture(n_rates=40)
+    # дубль дня в конце потока — попадает в другой шард, чем остальные цены тарифа
+    prices = prices + [replace(prices[0], amount=prices[0].amount - 1)]
+    serial = list(lazy_offers(hotels, room_types, rates, prices, avails, predicate=lambda m: True))
+    batch = PriceBatch((p.id, p.rate_id, p.date, p.amount, p.currency) for p in prices)
+
+    assert list(lazy_offers(hotels, room_types, rates, batch, avails, lambda m: True, workers=2)) == serial
+    assert _offer_pool(2) is _offer_pool(2)
+    with ThreadPoolExecutor(2) as pool:
+        got = lazy_offers(hotels, room_types, rates, prices, avails, lambda m: True, workers=5, executor=pool)
+        assert list(got) == serial
+
+
+def test_window_best_price_matches_price_scan():
+    from core.offers import lazy_offers
+
+    hotels, room_types, rates, prices, avails = offer_fixture()
+    dup = prices[3]
+    prices = prices + [replace(dup, id=10**6, amount=1)]
+    today = date.today()
+    for lookahead in (0, 1, 30, 365):
+        window = {(today + timedelta(days=i)).isoformat() for i in range(lookahead)}
+        avail = {(a.room_type_id, a.date): a.available for a in avails}
+        expected = []
+        for rp in rates:
+            amounts = [p.amount for p in prices
+                       if p.rate_id == rp.id and p.date in window and avail.get((rp.room_type_id, p.date), 0) > 0]
+            if amounts:
+                expected.append((rp.id, min(amounts)))
+        got = [(rp.id, best) for _, _, rp, best in lazy_offers(
+            hotels, room_types, rates, prices, avails, predicate=lambda m: True, lookahead_days=lookahead)]
+        assert got == expected
+
+
+def test_lazy_offers_reads_materialized_window_mins():
+    from core.domain import WindowMins
+    from core.offers import lazy_offers
+
+    hotels, room_types, rates, prices, avails = offer_fixture()
+    serial = list(lazy_offers(hotels, room_types, rates, prices, avails, predicate=lambda m: m["refundable"]))
+    mins = {rp.id: None for rp in rates} | {rp.id: best for _, _, rp, best in
+                                            lazy_offers(hotels, room_types, rates, prices, avails, predicate=lambda m: True)}
+    got = lazy_offers(hotels, room_types, rates, (), (), predicate=lambda m: m["refundable"],
+                      window_mins=WindowMins(60, mins))
+    assert list(got) == serial
+
+    for wrong in (WindowMins(30, mins), mins):
+        with pytest.raises(ValueError):
+            lazy_offers(hotels, room_types, rates, (), (), predicate=lambda m: True, window_mins=wrong)
+
+
+def test_lazy_offers_scans_rates_not_covered_by_window_mins():
+    from core.domain import WindowMins
+    from core.offers import lazy_offers
+
+    hotels, room_types, rates, prices, avails = offer_fixture()
+    serial = list(lazy_offers(hotels, room_types, rates, prices, avails, predicate=lambda m: True))
+    bogus = {rp.id: 1 for rp in rates}
+    # минимумы без учёта остатков (тарифов нет в rate_plans) и неполные — скан цен
+    for mins in (WindowMins(60, bogus, {rp.id: None for rp in rates}), WindowMins(60, list(bogus.items())[1:])):
+        assert list(lazy_offers(hotels, room_types, rates, prices, avails, lambda m: True, window_mins=mins)) == serial
+    covered = WindowMins(60, bogus, {rp.id: rp.room_type_id for rp in rates})
+    assert {o[3] for o in lazy_offers(hotels, room_types, rates, (), (), lambda m: True, window_mins=covered)} == {1}
+
+
+def test_price_series_range_queries():
+    import random
+    from core.indexes import PriceSeries, index_price_series_by_rate
+
+    prices, _, _ = seed_data()
+    series = index_price_series_by_rate(prices)
+    s = series[2001]
+    by_day = sorted((date.fromisoformat(p.date).toordinal(), p.amount) for p in prices if p.rate_id == 2001)
+    assert list(s.days) == [d for d, _ in by_day] and len(s) == len(by_day)
+
+    rng = random.Random(11)
+    lo, hi = by_day[0][0] - 5, by_day[-1][0] + 5
+    for _ in range(200):
+        start = rng.randrange(lo, hi)
+        end = start + rng.randrange(-2, 40)
+        inside = [a for d, a in by_day if start <= d < end]
+        days, amounts = s.slice(start, end)
+        assert list(amounts) == inside and all(start <= d < end for d in days)
+        assert s.min_in(start, end) == min(inside, default=None)
+        assert s.sum_in(start, end) == sum(inside)
+    assert len(PriceSeries(())) == 0 and PriceSeries(()).min_in(0, 10) is None
+
+
+def test_lazy_offers_accepts_price_series():
+    from core.indexes import index_price_series_by_rate
+    from core.offers import lazy_offers
+
+    hotels, room_types, rates, prices, avails = offer_fixture()
+    prices = prices + [replace(prices[10], id=10**6, amount=prices[10].amount - 1)]
+    series = index_price_series_by_rate(prices)
+    for lookahead in (7, 60, 365):
+        serial = list(lazy_offers(hotels, room_types, rates, prices, avails, lambda m: True, lookahead))
+        assert list(lazy_offers(hotels, room_types, rates, series, avails, lambda m: True, lookahead)) == serial
+        assert list(lazy_offers(hotels, room_types, rates, series, avails, lambda m: True, lookahead, workers=2)) == serial
+
+
+def test_domain_records_are_slotted():
+    prices, avails, rules = seed_data()
+    for rec in (prices[0], avails[0], rules[0]):
+        assert not hasattr(rec, "__dict__")
+    with pytest.raises(AttributeError):
+        prices[0].amount = 1
@@ -0,0 +1,41 @@
+import json
+from datetime import date, timedelta
+
+from core.domain import Rule
+from core.rules import (
+    CompiledRules, compile_rules, get_min_stay, get_max_stay, is_cta_date, is_ctd_date,
+)
+
+
+def seed_rules():
+    data = json.load(open("Data/seed.json", encoding="utf-8"))
+    return tuple(Rule(r["id"], r["kind"], r["payload"]) for r in data["rules"])
+
+
+def test_compiled_rules_match_linear_scan():
+    rules = seed_rules()
+    compiled = CompiledRules(rules)
+    keys = {(r.payload.get("room_type_id"), r.payload.get("rate_id")) for r in rules} | {(1001, 2001)}
+    days = [(date(2025, 11, 20) + timedelta(days=i)).isoformat() for i in range(60)]
+    for rt, rp in keys:
+        assert compiled.min_stay(rt, rp) == get_min_stay(rules, rt, rp)
+        assert compiled.max_stay(rt, rp) == get_max_stay(rules, rt, rp)
+        for d in days + [None]:
+            assert is_cta_date(compiled, rt, rp, d) == is_cta_date(rules, rt, rp, d)
+            assert is_ctd_date(compiled, rt, rp, d) == is_ctd_date(rules, rt, rp, d)
+
+
+def test_compiled_rules_first_match_and_bad_values():
+    rules = (
+        Rule(1, "cta", {"room_type_id": 1, "rate_id": 2, "date": "2025-01-01", "value": False}),
+        Rule(2, "cta", {"room_type_id": 1, "rate_id": 2, "date": "2025-01-01", "value": True}),
+        Rule(3, "min_stay", {"room_type_id": 1, "rate_id": 2, "value": "oops"}),
+        Rule(4, "min_stay", {"room_type_id": 1, "rate_id": 2, "value": 4}),
+        Rule(5, "max_stay", {"room_type_id": 1, "rate_id": 2, "value": 2}),
+    )
+    compiled = compile_rules(rules)
+    assert compile_rules(compiled) is compiled
+    assert is_cta_date(compiled, 1, 2, "2025-01-01") is False
+    assert get_min_stay(compiled, 1, 2) == 4
+    assert get_max_stay(compiled, 1, 2) == 2
+    assert get_min_stay(compiled, None, 2) == get_min_stay(rules, None, 2) == 4
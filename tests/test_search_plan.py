@@ -0,0 +1,63 @@
+import itertools
+
+from core.filtres import (
+    HotelSearch, plan_hotel_search, filter_hotels,
+    make_city_filter, make_price_range_filter, make_stars_filter,
+)
+from tools import db
+from tools.utils import parse_list_field, norm_token
+
+
+def _presence(key, selected, require_all):
+    pats = {norm_token(x) for x in selected}
+
+    def pred(h):
+        if not pats:
+            return True
+        vals = {norm_token(x) for x in h[key]}
+        return bool(vals) and (pats <= vals if require_all else bool(pats & vals))
+    return pred
+
+
+def _item(r):
+    return {
+        "id": int(r[0]), "city": r[2], "price": int(r[3]), "rating": float(r[4]),
+        "roomtype_list": parse_list_field(r[7]), "rateplan_list": parse_list_field(r[8]),
+    }
+
+
+def _python_search(rows, s: HotelSearch):
+    """Старый путь страницы поиска: всё из БД, фильтры в Python."""
+    preds = [
+        make_city_filter(s.city),
+        make_price_range_filter(0, s.max_price),
+        make_stars_filter(s.min_stars),
+        _presence("roomtype_list", s.room_types, s.room_types_all),
+        _presence("rateplan_list", s.extras, s.extras_all),
+    ]
+    return sorted(h["id"] for h in filter_hotels([_item(r) for r in rows], preds))
+
+
+def _planned_search(s: HotelSearch):
+    sql, residual = plan_hotel_search(s)
+    items = [_item(r) for r in db.fetch_hotels(**sql)]
+    return sorted(h["id"] for h in filter_hotels(items, residual))
+
+
+def test_plan_matches_python_filtering(seeded_db):
+    all_rows = db.fetch_hotels()
+    for city, max_price, stars, types, extras, mode in itertools.product(
+        [None, "Almaty"], [0, 17852, 18000, 50000], [1, 3, 4, 5],
+        [(), ("VIP Plus",), ("Standard", "VIP Deluxe")], [(), ("Wi-Fi", "Pool")], [False, True],
+    ):
+        s = HotelSearch(city=city, max_price=max_price, min_stars=stars,
+                        room_types=types, room_types_all=mode, extras=extras, extras_all=not mode)
+        assert _planned_search(s) == _python_search(all_rows, s), s
+
+
+def test_plan_pushes_filters_into_sql():
+    sql, residual = plan_hotel_search(HotelSearch(city="Almaty", max_price=100, min_stars=4,
+                                                  room_types=("Standard",), extras=("Bar",), extras_all=True))
+    assert sql == {"city": "Almaty", "max_price": 101, "min_rating": 3.5,
+                   "any_types": ["Standard"], "all_plans": ["Bar"]}
+    assert len(residual) == 2
@@ -0,0 +1,25 @@
+import json
+
+from tools.utils import iter_json_arrays
+
+
+def test_iter_json_arrays_matches_json_load():
+    data = json.load(open("Data/seed.json", encoding="utf-8"))
+    got = {}
+    for key, batch in iter_json_arrays("Data/seed.json", batch_size=7, chunk_size=13):
+        assert len(batch) <= 7
+        got.setdefault(key, []).extend(batch)
+    assert got == data
+
+
+def test_iter_json_arrays_handles_numbers_split_across_chunks(tmp_path):
+    p = tmp_path / "t.json"
+    p.write_text('{"a": 12345, "b": [], "c": [1.5e3 , {"x": [1, 2]}, -7], "d": "s"}', encoding="utf-8")
+    for chunk_size in (1, 2, 5):
+        assert list(iter_json_arrays(str(p), chunk_size=chunk_size)) == [
+            ("a", [12345]), ("c", [1500.0, {"x": [1, 2]}, -7]), ("d", ["s"]),
+        ]
+
+
+def test_iter_json_arrays_missing_file(tmp_path):
+    assert list(iter_json_arrays(str(tmp_path / "nope.json"))) == []
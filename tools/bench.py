@@ -0,0 +1,202 @@
+# tools/bench.py
+"""Микробенчмарки горячих функций.
+
+    python -m tools.bench            # все
+    python -m tools.bench dates      # выбранные
+"""
+import json
+import os
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+from dataclasses import make_dataclass
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Tuple
+
+from core import dates
+from core.domain import Price, Availability
+from core.domain import Hotel, RoomType, RatePlan, PriceBatch
+from core.offers import lazy_offers, quote_offer, quote_offers
+from core.indexes import DenseInventory, MISSING, index_price_series_by_rate, index_prices_by_rate_date, index_avail_by_rt_date
+
+Case = Tuple[str, Callable[[], object]]
+
+
+def _report(title: str, cases: List[Case], number: int):
+    print(f"== {title} (x{number})")
+    base = None
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=number, repeat=5))
+        base = base or best
+        print(f"  {name:<32} {best * 1e3:8.2f} ms  x{base / best:5.1f}")
+
+
+def bench_dates(number: int = 20):
+    start = date.today()
+    days = [start + timedelta(days=i) for i in range(365)]
+    isos = [d.isoformat() for d in days]
+    far = [d.replace(year=d.year + 10) for d in days]   # вне горизонта таблицы
+    far_isos = [d.isoformat() for d in far]
+
+    _report("to_date", [
+        ("strptime (прежний)", lambda: [dates._strptime_date(s) for s in isos]),
+        ("to_date, горизонт", lambda: [dates.to_date(s) for s in isos]),
+        ("to_date, вне горизонта", lambda: [dates.to_date(s) for s in far_isos]),
+    ], number)
+    _report("to_iso", [
+        ("strftime (прежний)", lambda: [dates._strftime_iso(d) for d in days]),
+        ("to_iso, горизонт", lambda: [dates.to_iso(d) for d in days]),
+        ("to_iso, вне горизонта", lambda: [dates.to_iso(d) for d in far]),
+    ], number)
+
+
+def _seed_inventory(seed_path: str = "Data/seed.json"):
+    with open(seed_path, encoding="utf-8") as f:
+        data = json.load(f)
+    prices = tuple(Price(p["id"], p["rate_id"], p["date"], p["amount"], p.get("currency", "KZT"),
+                         dates.iso_to_ordinal(p["date"])) for p in data["prices"])
+    avails = tuple(Availability(a["id"], a["room_type_id"], a["date"], a["available"],
+                                dates.iso_to_ordinal(a["date"])) for a in data["availability"])
+    return prices, avails
+
+
+def _deep_size(obj) -> int:
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_deep_size(k) + _deep_size(v) for k, v in obj.items())
+    if isinstance(obj, tuple):
+        return sys.getsizeof(obj) + sum(_deep_size(x) for x in obj)
+    return sys.getsizeof(obj)
+
+
+def bench_inventory(number: int = 20):
+    prices, avails = _seed_inventory()
+    p_idx, a_idx = index_prices_by_rate_date(prices), index_avail_by_rt_date(avails)
+    inv = DenseInventory(prices, avails)
+    horizon = [date.fromordinal(d) for d in range(inv.start, inv.end)]
+    rate_ids = sorted(inv.prices)
+
+    def scan_dict():
+        # прежний горячий цикл: ISO-строка на ночь + кортеж-ключ
+        return [[p_idx.get((rid, dates._strftime_iso(d))) for d in horizon] for rid in rate_ids]
+
+    def scan_dense():
+        return [[v if v != MISSING else None for v in inv.price_vector(rid)] for rid in rate_ids]
+
+    assert scan_dict() == scan_dense()
+    _report("build", [
+        ("dict (rate, iso)", lambda: (index_prices_by_rate_date(prices), index_avail_by_rt_date(avails))),
+        ("DenseInventory", lambda: DenseInventory(prices, avails, inv.start, inv.end)),
+    ], number)
+    _report("scan all rates over horizon", [
+        ("dict (rate, iso)", scan_dict),
+        ("DenseInventory vectors", scan_dense),
+    ], number)
+    dict_bytes = _deep_size(p_idx) + _deep_size(a_idx)
+    dense_bytes = sum(sys.getsizeof(v) for v in (*inv.prices.values(), *inv.avails.values()))
+    print(f"  memory: dict {dict_bytes / 1024:.0f} KiB, dense {dense_bytes / 1024:.0f} KiB")
+
+
+def bench_quotes(number: int = 3):
+    prices, avails = _seed_inventory()
+    first = date.fromordinal(min(p.day for p in prices))
+    stays = [((first + timedelta(days=i)).isoformat(), (first + timedelta(days=i + n)).isoformat())
+             for i in range(50) for n in range(1, 11)]
+
+    _report(f"{len(stays)} stays, rate 2001", [
+        ("quote_offer в цикле", lambda: [quote_offer(2001, 1001, cin, cout, prices, avails, ()) for cin, cout in stays]),
+        ("quote_offers (префиксы)", lambda: quote_offers(2001, 1001, stays, prices, avails, ())),
+    ], number)
+
+
+def _portfolio(n_rates: int, horizon: int, seed: int = 1):
+    """Синтетический портфель: n_rates тарифов, цены и остатки на horizon дней от сегодня."""
+    rng = random.Random(seed)
+    today = date.today()
+    days = [(today + timedelta(days=i)).isoformat() for i in range(horizon)]
+    n_hotels = max(1, n_rates // 10)
+    hotels = [Hotel(i, f"H{i}", 1 + i % 5, "Almaty", ()) for i in range(n_hotels)]
+    room_types = [RoomType(i, i, "Std", 2, (), ()) for i in range(n_hotels)]
+    rates = [RatePlan(i, i % n_hotels, i % n_hotels, f"R{i}", "BB", True, None) for i in range(n_rates)]
+    prices = [Price(0, rp.id, d, rng.randrange(10_000, 90_000), "KZT", today.toordinal() + i)
+              for rp in rates for i, d in enumerate(days)]
+    avails = [Availability(0, rt.id, d, rng.choice((0, 1, 3)), today.toordinal() + i)
+              for rt in room_types for i, d in enumerate(days)]
+    return hotels, room_types, rates, prices, avails
+
+
+def bench_offers(number: int = 1, n_rates: int = 5000, horizon: int = 60):
+    hotels, room_types, rates, prices, avails = _portfolio(n_rates, horizon)
+    batch = PriceBatch((p.id, p.rate_id, p.date, p.amount, p.currency, p.day) for p in prices)
+    cpus = os.cpu_count() or 1
+    offers = lambda p, **kw: list(lazy_offers(hotels, room_types, rates, p, avails, lambda m: True, horizon, **kw))
+    cases = [("serial", lambda: offers(prices)), ("serial, PriceBatch", lambda: offers(batch))]
+    for workers in sorted({2, cpus}):
+        if workers > 1:
+            # пул общий между вызовами: старт процессов не попадает в лучший из повторов
+            cases.append((f"workers={workers}", lambda w=workers: offers(prices, workers=w)))
+            cases.append((f"workers={workers}, PriceBatch", lambda w=workers: offers(batch, workers=w)))
+    _report(f"lazy_offers, {n_rates} rates x {horizon} days", cases, number)
+    # CPU родителя: его доля — последовательная часть, она и ограничивает ускорение от воркеров
+    print(f"  cpus={cpus}")
+    for name, fn in cases:
+        started = time.process_time()
+        fn()
+        print(f"  {name:<32} parent cpu {(time.process_time() - started) * 1e3:8.2f} ms")
+
+
+def bench_series(number: int = 3, n_rates: int = 2000, horizon: int = 365, lookahead: int = 30):
+    hotels, room_types, rates, prices, avails = _portfolio(n_rates, horizon)
+    series = index_price_series_by_rate(prices)
+    offers = lambda p: list(lazy_offers(hotels, room_types, rates, p, avails, lambda m: True, lookahead))
+    assert offers(prices) == offers(series)
+    _report(f"lazy_offers {lookahead}d over {horizon}d history, {n_rates} rates", [
+        ("list[Price]", lambda: offers(prices)),
+        ("PriceSeries (готовый индекс)", lambda: offers(series)),
+    ], number)
+
+
+def _allocated(fn: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        result = fn()  # живой до снятия замера
+        size = tracemalloc.get_traced_memory()[0]
+        del result
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def bench_domain(number: int = 3, n_rows: int = 365 * 300):
+    """Годовой инвентарь: Price с __dict__ против slots=True и колоночного PriceBatch."""
+    DictPrice = make_dataclass("DictPrice", [("id", int), ("rate_id", int), ("date", str), ("amount", int),
+                                             ("currency", str), ("day", int)], frozen=True)
+    first = date.today().toordinal()
+    rows = [(i, 2000 + i // 365, dates.ordinal_to_iso(first + i % 365), 10_000 + i % 997, "KZT", first + i % 365)
+            for i in range(n_rows)]
+
+    cases = [
+        ("dataclass с __dict__", lambda: [DictPrice(*r) for r in rows]),
+        ("Price (slots=True)", lambda: [Price(*r) for r in rows]),
+        ("PriceBatch", lambda: PriceBatch(rows)),
+    ]
+    _report(f"build {n_rows} rows", cases, number)
+    for name, fn in cases:
+        print(f"  {name:<32} {_allocated(fn) / n_rows:8.1f} B/row")
+
+
+BENCHES: Dict[str, Callable[[], None]] = {
+    "dates": bench_dates,
+    "inventory": bench_inventory,
+    "quotes": bench_quotes,
+    "offers": bench_offers,
+    "offers365": lambda: bench_offers(n_rates=2000, horizon=365),
+    "series": bench_series,
+    "domain": bench_domain,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHES:
+        BENCHES[name]()
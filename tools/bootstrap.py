@@ -0,0 +1,52 @@
+# tools/bootstrap.py
+"""Однократная подготовка базы: схема + сид.
+
+Streamlit перезапускает app/main.py на каждый клик, поэтому init_db()/seed_database()
+нельзя звать напрямую на уровне модуля. bootstrap_database() выполняет работу один раз
+на процесс, а между процессами сверяет версию схемы и отпечаток сид-файла из таблицы meta.
+"""
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional
+
+from tools import db
+
+_lock = threading.Lock()
+_done: set[str] = set()
+
+
+def seed_fingerprint(seed_path: str, chunk_size: int = 1 << 20) -> Optional[str]:
+    """sha256 содержимого сид-файла (читается кусками); None — файла нет."""
+    p = Path(seed_path)
+    if not p.exists():
+        return None
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    # версия схемы входит в отпечаток: после миграции сид нужно пролить заново
+    return f"v{db.SCHEMA_VERSION}:{h.hexdigest()}"
+
+
+def bootstrap_database(seed_path: str = "Data/seed.json", force: bool = False) -> bool:
+    """Готовит схему и сид. Возвращает True, если в этом вызове что-то проверялось/делалось."""
+    key = f"{Path(db.DB_PATH).resolve()}|{Path(seed_path).resolve()}"
+    if key in _done and not force:
+        return False
+
+    with _lock:
+        if key in _done and not force:
+            return False
+
+        if force or db.get_meta("schema_version") != str(db.SCHEMA_VERSION):
+            db.init_db()
+            db.set_meta("schema_version", str(db.SCHEMA_VERSION))
+
+        fingerprint = seed_fingerprint(seed_path)
+        if fingerprint and (force or db.get_meta("seed_fingerprint") != fingerprint):
+            db.seed_database(seed_path)
+            db.set_meta("seed_fingerprint", fingerprint)
+
+        _done.add(key)
+    return True
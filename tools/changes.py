@@ -0,0 +1,75 @@
+# tools/changes.py
+"""Чтение журнала изменений данных (tools.db.record_changes).
+
+Каждая запись в БД получает номер из общей монотонной последовательности; таблицы и
+сущности хранят номер своего последнего изменения. ChangeFeed опрашивает журнал
+и раздаёт подписчикам изменения с прошлого опроса — так кэши (поиск, календари)
+сбрасываются точечно и работают между процессами: журнал лежит в самой БД.
+"""
+import threading
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from tools import db
+
+
+class Changes(NamedTuple):
+    since: int
+    version: int
+    tables: Dict[str, int]
+    entities: Dict[db.Entity, int]
+
+    def __bool__(self) -> bool:
+        return self.version > self.since
+
+    def ids(self, entity: str) -> set:
+        """id изменённых сущностей вида entity."""
+        return {i for e, i in self.entities if e == entity}
+
+    def touches(self, tables: Iterable[str]) -> bool:
+        return any(t in self.tables for t in tables)
+
+
+Handler = Callable[[Changes], Any]
+
+
+class ChangeFeed:
+    """Поллинг журнала изменений с подпиской.
+
+    feed = ChangeFeed()
+    feed.subscribe(lambda ch: cache.clear(), tables=("hotels",))
+    feed.poll()   # например, в начале каждого прогона страницы
+    """
+
+    def __init__(self, since: Optional[int] = None):
+        self.version = db.current_version() if since is None else since
+        self._subscribers: List[Tuple[Handler, Optional[frozenset]]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: Handler, tables: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """handler(changes) вызывается при опросе, если изменилась любая из tables
+        (None — любая таблица). Возвращает функцию отписки."""
+        entry = (handler, frozenset(tables) if tables is not None else None)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    def poll(self) -> Changes:
+        """Изменения после прошлого опроса; уведомляет подписчиков."""
+        with self._lock:
+            since = self.version
+            version, tables, entities = db.fetch_changes_since(since)
+            self.version = version
+            subscribers = list(self._subscribers)
+
+        changes = Changes(since, version, tables, entities)
+        if changes:
+            for handler, watched in subscribers:
+                if watched is None or changes.touches(watched):
+                    handler(changes)
+        return changes
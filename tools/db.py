@@ -1,23 +1,173 @@
 # tools/db.py
 import sqlite3
 import json
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import date
 from pathlib import Path
-from typing import Iterable, Optional, Tuple, List
+from typing import Dict, Iterable, Optional, Tuple, List, Union
 
-from tools.utils import load_json
-
-from core.domain import Price, Availability, Rule
+from core.domain import Price, Availability, Rule, PriceBatch, AvailabilityBatch, WindowMins
 from core.dates import month_grid_bounds
+from tools.utils import parse_list_field, norm_token
 
 DB_PATH = Path("Data/hotel_booking.db")
 
+# Увеличивать при любом изменении схемы: bootstrap заново выполнит init_db() и сид.
+SCHEMA_VERSION = 12
+
+
+# Настраиваются один раз при открытии соединения пула.
+# WAL: читатели не блокируются записью брони; synchronous=NORMAL безопасен в WAL.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA busy_timeout = 5000;",
+    "PRAGMA cache_size = -16000;",      # ~16 МБ на соединение
+    "PRAGMA mmap_size = 268435456;",    # 256 МБ
+    "PRAGMA temp_store = MEMORY;",
+)
+POOL_SIZE = 8
+
+
+class ConnectionPool:
+    """Потокобезопасный пул переиспользуемых sqlite3-соединений к одному файлу БД.
+
+    Соединение одновременно принадлежит только одному потоку (пока взято из пула),
+    поэтому check_same_thread=False безопасен.
+    """
+
+    def __init__(self, path: Path, size: int = POOL_SIZE, timeout: float = 30.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"no free SQLite connection for {self.path} in {self.timeout}s")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    pool = _pool
+    if pool is not None and pool.path == Path(DB_PATH):
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.path != Path(DB_PATH):
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
 
 def get_connection():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    return conn
+    """`with get_connection() as conn:` — соединение из пула; commit при успехе, rollback при ошибке."""
+    return get_pool().connection()
+
+
+# Вторичные индексы: имя -> (таблица, DDL). Bulk-загрузка (tools/seed.py) снимает их
+# на время заливки и строит заново одним проходом.
+INDEXES = {
+    "idx_hotels_city": ("hotels", "CREATE INDEX IF NOT EXISTS idx_hotels_city ON hotels(city);"),
+    "idx_hotels_owner": ("hotels", "CREATE INDEX IF NOT EXISTS idx_hotels_owner ON hotels(owner_id);"),
+    "idx_hotels_price": ("hotels", "CREATE INDEX IF NOT EXISTS idx_hotels_price ON hotels(price);"),
+    "idx_hotels_rating": ("hotels", "CREATE INDEX IF NOT EXISTS idx_hotels_rating ON hotels(rating);"),
+    "idx_hotels_name": ("hotels", "CREATE INDEX IF NOT EXISTS idx_hotels_name ON hotels(name);"),
+    "idx_hotel_roomtypes_token": (
+        "hotel_roomtypes", "CREATE INDEX IF NOT EXISTS idx_hotel_roomtypes_token ON hotel_roomtypes(roomtype, hotel_id);"
+    ),
+    "idx_hotel_amenities_token": (
+        "hotel_amenities", "CREATE INDEX IF NOT EXISTS idx_hotel_amenities_token ON hotel_amenities(amenity, hotel_id);"
+    ),
+    "idx_prices_rate_day": ("prices", "CREATE INDEX IF NOT EXISTS idx_prices_rate_day ON prices(rate_id, day);"),
+    "idx_avail_rt_day": ("availability", "CREATE INDEX IF NOT EXISTS idx_avail_rt_day ON availability(room_type_id, day);"),
+    "idx_rules_kind": ("rules", "CREATE INDEX IF NOT EXISTS idx_rules_kind ON rules(kind);"),
+    "idx_rules_scope": ("rules", "CREATE INDEX IF NOT EXISTS idx_rules_scope ON rules(rate_id, room_type_id);"),
+    "idx_rate_plans_room_type": ("rate_plans", "CREATE INDEX IF NOT EXISTS idx_rate_plans_room_type ON rate_plans(room_type_id);"),
+    "idx_entity_versions_version": (
+        "entity_versions", "CREATE INDEX IF NOT EXISTS idx_entity_versions_version ON entity_versions(version);"
+    ),
+}
+
+
+def create_indexes(cur, tables: Iterable[str]):
+    tables = set(tables)
+    for table, ddl in INDEXES.values():
+        if table in tables:
+            cur.execute(ddl)
+
+
+def drop_indexes(cur, tables: Iterable[str]):
+    tables = set(tables)
+    for name, (table, _) in INDEXES.items():
+        if table in tables:
+            cur.execute(f"DROP INDEX IF EXISTS {name};")
 
 
 def init_db():
@@ -62,148 +212,444 @@ def init_db():
             );
         """)
 
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_hotels_city ON hotels(city);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_hotels_owner ON hotels(owner_id);")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+        # Нормализованные (norm_token) типы номеров и услуги отеля — для индексного поиска
+        # вместо instr() по CSV/JSON в hotels.roomtype/rateplan. Ведёт sync_hotel_tokens().
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS hotel_roomtypes (
+                hotel_id INTEGER NOT NULL REFERENCES hotels(id) ON DELETE CASCADE,
+                roomtype TEXT NOT NULL,
+                PRIMARY KEY (hotel_id, roomtype)
+            ) WITHOUT ROWID;
+        """)
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS hotel_amenities (
+                hotel_id INTEGER NOT NULL REFERENCES hotels(id) ON DELETE CASCADE,
+                amenity TEXT NOT NULL,
+                PRIMARY KEY (hotel_id, amenity)
+            ) WITHOUT ROWID;
+        """)
+
+        # Журнал изменений (см. record_changes): версия — номер изменения из общей
+        # монотонной последовательности (строка CHANGE_SEQ в table_versions).
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS table_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+        """)
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS entity_versions (
+                entity TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (entity, id)
+            ) WITHOUT ROWID;
+        """)
+
+        create_indexes(cur, ("hotels", "users", "bookings", "hotel_roomtypes", "hotel_amenities", "entity_versions"))
+
+        # миграция со схемы v1: заполнить таблицы токенов по уже существующим отелям
+        if (cur.execute("SELECT 1 FROM hotels LIMIT 1").fetchone()
+                and not cur.execute("SELECT 1 FROM hotel_roomtypes LIMIT 1").fetchone()
+                and not cur.execute("SELECT 1 FROM hotel_amenities LIMIT 1").fetchone()):
+            sync_hotel_tokens(cur)
         conn.commit()
 
     ensure_calendar_tables()
 
 
-def ensure_calendar_tables():
-    with get_connection() as conn:
-        cur = conn.cursor()
+# Поля payload правила, вынесенные в колонки rules (NULL — ключа в payload нет).
+RULE_COLUMNS = ("room_type_id", "rate_id", "date", "value")
 
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS prices (
+
+def _migrate_rule_columns(cur):
+    """Схема < v5 хранила правило только JSON-ом в payload: добавляем колонки и заполняем их."""
+    have = {r[1] for r in cur.execute("PRAGMA table_info(rules)")}
+    missing = [c for c in RULE_COLUMNS if c not in have]
+    if not missing:
+        return
+    types = {"room_type_id": "INTEGER", "rate_id": "INTEGER", "date": "TEXT", "value": ""}
+    for c in missing:
+        cur.execute(f"ALTER TABLE rules ADD COLUMN {c} {types[c]}")
+    cur.execute(f"""
+        UPDATE rules SET {", ".join(f"{c} = json_extract(payload, '$.{c}')" for c in RULE_COLUMNS)}
+        WHERE json_valid(payload)
+    """)
+
+
+def rule_columns(payload: Optional[dict]) -> tuple:
+    """Значения колонок RULE_COLUMNS для payload правила."""
+    payload = payload or {}
+    value = payload.get("value")
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return (payload.get("room_type_id"), payload.get("rate_id"), payload.get("date"), value)
+
+
+# date TEXT -> date.toordinal() средствами SQLite: julianday('0001-01-01') = 1721425.5.
+SQL_DAY_ORDINAL = "CAST(julianday({col}) - 1721424.5 AS INTEGER)"
+# day вычисляется самой SQLite из date один раз при записи (STORED: чтения по day не пересчитывают
+# julianday); CHECK пускает только каноничные YYYY-MM-DD — иначе julianday дал бы NULL или молча
+# сдвинул 2024-02-30 на 1 марта, разойдясь с core.dates.iso_to_ordinal. Проверка идёт через
+# julianday: date('2024-02-30') возвращает строку как есть.
+SQL_DAY_COLUMN = f"day INTEGER GENERATED ALWAYS AS ({SQL_DAY_ORDINAL.format(col='date')}) STORED"
+SQL_DATE_CHECK = "CHECK (date(julianday(date)) IS date)"
+
+# Таблицы с колонкой day: DDL (имя таблицы — {name}) и записываемые колонки.
+DAY_TABLES = {
+    "prices": (f"""
+        CREATE TABLE IF NOT EXISTS {{name}} (
             id INTEGER PRIMARY KEY,
             rate_id INTEGER NOT NULL,
             date TEXT NOT NULL,
             amount INTEGER NOT NULL,
-            currency TEXT NOT NULL
+            currency TEXT NOT NULL,
+            {SQL_DAY_COLUMN},
+            {SQL_DATE_CHECK}
         );
-        """)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_prices_rate_date ON prices(rate_id, date);")
-
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS availability (
+    """, ("id", "rate_id", "date", "amount", "currency")),
+    "availability": (f"""
+        CREATE TABLE IF NOT EXISTS {{name}} (
             id INTEGER PRIMARY KEY,
             room_type_id INTEGER NOT NULL,
             date TEXT NOT NULL,
-            available INTEGER NOT NULL
+            available INTEGER NOT NULL,
+            {SQL_DAY_COLUMN},
+            {SQL_DATE_CHECK}
         );
-        """)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_avail_rt_date ON availability(room_type_id, date);")
+    """, ("id", "room_type_id", "date", "available")),
+}
+
+
+def _migrate_day_columns(cur):
+    """day цен/остатков — хранимая генерируемая колонка, date — только каноничная дата.
+
+    Схема < v8 хранила даты только текстом, v8–v9 — обычной колонкой day, которую
+    заполнял код записи, v10 — виртуальной без CHECK. Такие таблицы пересоздаются:
+    ALTER TABLE не добавляет ни STORED-колонку, ни CHECK. Даты переносятся приведёнными
+    к каноничному виду, строки с датой, которую SQLite не разбирает (их day и раньше был
+    NULL), не переносятся.
+    Индексы по day строит create_indexes.
+    """
+    for table, (ddl, columns) in DAY_TABLES.items():
+        # table_xinfo: hidden = 3 — хранимая генерируемая колонка
+        hidden = {r[1]: r[6] for r in cur.execute(f"PRAGMA table_xinfo({table})")}
+        if hidden.get("day") == 3:
+            continue
+        cols = ", ".join(columns)
+        picked = ", ".join("date(julianday(date))" if c == "date" else c for c in columns)
+        cur.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        cur.execute(ddl.format(name=table))
+        cur.execute(f"INSERT INTO {table} ({cols}) SELECT {picked} FROM {table}_old WHERE julianday(date) IS NOT NULL")
+        cur.execute(f"DROP TABLE {table}_old")
+
+
+# Пути БД, для которых DDL календарных таблиц уже выполнен в этом процессе.
+_calendar_schema_ready: set[Path] = set()
+
+
+def ensure_calendar_tables():
+    """Идемпотентный DDL для prices/availability/rules; в процессе выполняется один раз.
+
+    Пути чтения его не вызывают — схему готовят init_db()/bootstrap_database().
+    """
+    path = Path(DB_PATH)
+    if path in _calendar_schema_ready:
+        return
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        for table, (ddl, _) in DAY_TABLES.items():
+            cur.execute(ddl.format(name=table))
 
         cur.execute("""
         CREATE TABLE IF NOT EXISTS rules (
             id INTEGER PRIMARY KEY,
             kind TEXT NOT NULL,
-            payload TEXT NOT NULL
+            payload TEXT NOT NULL,
+            room_type_id INTEGER,
+            rate_id INTEGER,
+            date TEXT,
+            value
+        );
+        """)
+        _migrate_rule_columns(cur)
+        _migrate_day_columns(cur)
+
+        # тариф -> тип номера: нужен, чтобы сопоставить цены тарифа с остатками
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rate_plans (
+            id INTEGER PRIMARY KEY,
+            hotel_id INTEGER,
+            room_type_id INTEGER NOT NULL,
+            title TEXT,
+            meal TEXT,
+            refundable INTEGER NOT NULL DEFAULT 0,
+            cancel_before_days INTEGER
         );
         """)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_rules_kind ON rules(kind);")
 
+        # минимальная цена тарифа в окне [start_day, start_day + window_days) при остатке
+        # room_type_id; room_type_id NULL — тариф без rate_plans, минимум только по ценам
+        have = {r[1] for r in cur.execute("PRAGMA table_info(rate_window_mins)")}
+        if have and "room_type_id" not in have:
+            # агрегат производный: до v11 без room_type_id — пересобирается при следующем сдвиге
+            cur.execute("DROP TABLE rate_window_mins")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rate_window_mins (
+            rate_id INTEGER NOT NULL,
+            window_days INTEGER NOT NULL,
+            start_day INTEGER NOT NULL,
+            room_type_id INTEGER,
+            min_price INTEGER,
+            PRIMARY KEY (rate_id, window_days)
+        ) WITHOUT ROWID;
+        """)
+        create_indexes(cur, ("prices", "availability", "rules", "rate_plans"))
         conn.commit()
 
+    _calendar_schema_ready.add(path)
 
-def _list_to_csv(value) -> Optional[str]:
-    if value is None:
-        return None
-    if isinstance(value, list):
-        items = [str(t).strip() for t in value if t]
-        return ",".join(items)
-    if isinstance(value, str):
-        return value.strip() or None
-    return str(value)
 
+def _chunks(seq: list, size: int = 500):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
 
-def seed_database(seed_path: str = "Data/seed.json"):
-    data = load_json(seed_path)
-    if not data:
-        return
 
-    ensure_calendar_tables()
+def sync_hotel_tokens(cur, hotel_ids: Optional[Iterable[int]] = None):
+    """Пересобирает hotel_roomtypes/hotel_amenities из hotels.roomtype/rateplan.
 
-    with get_connection() as conn:
-        cur = conn.cursor()
+    hotel_ids=None — для всех отелей. Вызывать в транзакции записи отеля.
+    """
+    if hotel_ids is None:
+        cur.execute("DELETE FROM hotel_roomtypes")
+        cur.execute("DELETE FROM hotel_amenities")
+        batches = [cur.execute("SELECT id, roomtype, rateplan FROM hotels").fetchall()]
+    else:
+        batches = []
+        for chunk in _chunks(list(hotel_ids)):
+            marks = ",".join("?" * len(chunk))
+            cur.execute(f"DELETE FROM hotel_roomtypes WHERE hotel_id IN ({marks})", chunk)
+            cur.execute(f"DELETE FROM hotel_amenities WHERE hotel_id IN ({marks})", chunk)
+            batches.append(cur.execute(
+                f"SELECT id, roomtype, rateplan FROM hotels WHERE id IN ({marks})", chunk
+            ).fetchall())
+
+    for rows in batches:
+        cur.executemany(
+            "INSERT OR IGNORE INTO hotel_roomtypes(hotel_id, roomtype) VALUES (?, ?)",
+            [(r[0], t) for r in rows for t in {norm_token(x) for x in parse_list_field(r[1])} if t],
+        )
+        cur.executemany(
+            "INSERT OR IGNORE INTO hotel_amenities(hotel_id, amenity) VALUES (?, ?)",
+            [(r[0], t) for r in rows for t in {norm_token(x) for x in parse_list_field(r[2])} if t],
+        )
 
-        for h in data.get("hotels", []):
-            roomtype_str = _list_to_csv(h.get("roomtype"))
-            rateplan_str = _list_to_csv(h.get("rateplan"))
-            owner_id = h.get("owner_id")
 
-            cur.execute("""
-                INSERT OR IGNORE INTO hotels
-                (id, name, city, price, rating, rooms, available, roomtype, rateplan, owner_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                h["id"], h.get("name"), h.get("city"), h.get("price"), h.get("rating"),
-                h.get("rooms"), int(h.get("available", 0)), roomtype_str, rateplan_str,
-                owner_id
-            ))
+# Сущности журнала изменений: (entity, id).
+#   hotels/users/bookings — строки одноимённых таблиц;
+#   rates — цены тарифа (prices.rate_id), room_types — остатки (availability.room_type_id).
+# Бронь меняет и свой отель ("hotels", hotel_id): у него поменялся список броней.
+CHANGE_SEQ = "*"
+
+Entity = Tuple[str, int]
+
+
+def next_change_version(cur) -> int:
+    """Следующий номер общей последовательности изменений (в текущей транзакции записи)."""
+    cur.execute("""
+        INSERT INTO table_versions(name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, (CHANGE_SEQ,))
+    return int(cur.execute(
+        "SELECT version FROM table_versions WHERE name = ?", (CHANGE_SEQ,)
+    ).fetchone()[0])
+
+
+def record_changes(
+    cur, tables: Iterable[str], entities: Iterable[Entity] = (), version: Optional[int] = None,
+) -> int:
+    """Отмечает изменение таблиц и сущностей в текущей транзакции записи.
+
+    Берёт следующий номер из общей последовательности и проставляет его всем
+    переданным таблицам и сущностям; возвращает этот номер. Откат транзакции
+    откатывает и версии. version — уже выданный next_change_version номер: так
+    длинная транзакция (bulk-загрузка) отмечает сущности по пачкам одним номером.
+    """
+    if version is None:
+        version = next_change_version(cur)
+    cur.executemany("""
+        INSERT INTO table_versions(name, version) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET version = excluded.version
+    """, [(t, version) for t in dict.fromkeys(tables)])
+    cur.executemany("""
+        INSERT INTO entity_versions(entity, id, version) VALUES (?, ?, ?)
+        ON CONFLICT(entity, id) DO UPDATE SET version = excluded.version
+    """, [(e, i, version) for e, i in dict.fromkeys((e, int(i)) for e, i in entities)])
+    return version
+
+
+def current_version() -> int:
+    """Номер последнего изменения (0 — изменений не было)."""
+    return fetch_table_versions((CHANGE_SEQ,))[CHANGE_SEQ]
+
+
+def fetch_table_versions(tables: Iterable[str]) -> Dict[str, int]:
+    """Версии таблиц (0 — таблица ещё не менялась)."""
+    tables = list(dict.fromkeys(tables))
+    if not tables:
+        return {}
+    marks = ",".join("?" * len(tables))
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT name, version FROM table_versions WHERE name IN ({marks})", tables
+        ).fetchall()
+    found = {r[0]: int(r[1]) for r in rows}
+    return {t: found.get(t, 0) for t in tables}
 
-        for u in data.get("users", []):
-            cur.execute("""
-                INSERT OR IGNORE INTO users (id, username, email, password, role)
-                VALUES (?, ?, ?, ?, ?)
-            """, (u["id"], u["username"], u["email"], u["password"], u["role"]))
 
-        for b in data.get("bookings", []):
-            cur.execute("""
-                INSERT OR IGNORE INTO bookings (id, user_id, hotel_id, check_in, check_out, guests)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (b["id"], b["user_id"], b["hotel_id"], b["check_in"], b["check_out"], b["guests"]))
+def fetch_entity_versions(entity: str, ids: Iterable[int]) -> Dict[int, int]:
+    """Версии сущностей вида entity (0 — сущность ещё не менялась)."""
+    ids = sorted(set(int(i) for i in ids))
+    out = dict.fromkeys(ids, 0)
+    with get_connection() as conn:
+        for chunk in _chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT id, version FROM entity_versions WHERE entity = ? AND id IN ({marks})",
+                (entity, *chunk),
+            ).fetchall()
+            out.update((int(r[0]), int(r[1])) for r in rows)
+    return out
+
+
+def fetch_changes_since(since: int) -> Tuple[int, Dict[str, int], Dict[Entity, int]]:
+    """(текущая версия, таблицы, сущности), изменённые после версии since."""
+    with get_connection() as conn:
+        conn.execute("BEGIN")  # оба запроса — из одного снимка БД
+        rows = conn.execute(
+            "SELECT name, version FROM table_versions WHERE version > ?", (since,)
+        ).fetchall()
+        tables = {r[0]: int(r[1]) for r in rows}
+        rows = conn.execute(
+            "SELECT entity, id, version FROM entity_versions WHERE version > ? ORDER BY version", (since,)
+        ).fetchall()
+    version = tables.pop(CHANGE_SEQ, since)
+    return version, tables, {(r[0], int(r[1])): int(r[2]) for r in rows}
+
+
+def calendar_data_versions(pairs: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], Tuple[int, int, int]]:
+    """(room_type_id, rate_id) -> (версия цен тарифа, версия остатков типа номера, версия rules).
+
+    Изменение цен одного тарифа не инвалидирует календари остальных.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+    rates = fetch_entity_versions("rates", (rp for _, rp in pairs))
+    room_types = fetch_entity_versions("room_types", (rt for rt, _ in pairs))
+    rules = fetch_table_versions(("rules",))["rules"]
+    return {(rt, rp): (rates[rp], room_types[rt], rules) for rt, rp in pairs}
+
+
+def get_meta(key: str) -> Optional[str]:
+    try:
+        with get_connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        # таблицы meta ещё нет — база не инициализирована
+        return None
+    return row[0] if row else None
 
-        for p in data.get("prices", []):
-            cur.execute("""
-                INSERT OR REPLACE INTO prices(id, rate_id, date, amount, currency)
-                VALUES(?,?,?,?,?)
-            """, (p.get("id"), p["rate_id"], p["date"], p["amount"], p.get("currency", "KZT")))
 
-        for a in data.get("availability", []):
-            cur.execute("""
-                INSERT OR REPLACE INTO availability(id, room_type_id, date, available)
-                VALUES(?,?,?,?)
-            """, (a.get("id"), a["room_type_id"], a["date"], a["available"]))
+def set_meta(key: str, value: str):
+    with get_connection() as conn:
+        conn.execute("""
+            INSERT INTO meta(key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (key, str(value)))
+        conn.commit()
 
-        for r in data.get("rules", []):
-            cur.execute("""
-                INSERT OR REPLACE INTO rules(id, kind, payload)
-                VALUES(?,?,?)
-            """, (r.get("id"), r["kind"], json.dumps(r.get("payload", {}))))
 
-        conn.commit()
+def seed_database(seed_path: str = "Data/seed.json", report=None):
+    """Заливает сид bulk-загрузчиком (tools/seed.py). Возвращает статистику по таблицам."""
+    from tools.seed import load_seed  # tools.seed сам импортирует tools.db
+
+    return load_seed(seed_path, report=report)
 
 
 def _add_token_filters_sql(
     base_query_parts: list[str],
     params: list,
+    table: str,
     column: str,
     tokens: Iterable[str],
     require_all: bool
 ):
-    tokens = [t for t in (tokens or []) if str(t).strip()]
-    if not tokens:
+    """Any — отель есть в junction-таблице хотя бы с одним токеном; All — со всеми (GROUP BY/HAVING)."""
+    keys = sorted({norm_token(t) for t in (tokens or []) if str(t).strip()} - {""})
+    if not keys:
         return
 
-    groups = []
-    for t in tokens:
-        groups.append(
-            f"(instr(',' || COALESCE({column}, '') || ',', ',' || ? || ',') > 0 "
-            f"OR instr(COALESCE({column}, ''), '\"' || ? || '\"') > 0)"
-        )
-        params.extend([t, t])
+    marks = ",".join("?" * len(keys))
+    sub = f"SELECT hotel_id FROM {table} WHERE {column} IN ({marks})"
+    if require_all and len(keys) > 1:
+        sub += f" GROUP BY hotel_id HAVING COUNT(*) = {len(keys)}"
+    base_query_parts.append(f" AND id IN ({sub})")
+    params.extend(keys)
+
 
-    if require_all:
-        for g in groups:
-            base_query_parts.append(" AND " + g)
+# Допустимые ключи сортировки fetch_hotels (у каждого есть индекс; id добавляется вторым ключом).
+HOTEL_SORT_KEYS = ("id", "name", "price", "rating")
+
+
+def _add_keyset_sql(query_parts: list[str], params: list, column: str, after: tuple, descending: bool):
+    """Условие «строго после курсора (value, id)» для ORDER BY column, id.
+
+    NULL в SQLite идут первыми по возрастанию и последними по убыванию.
+    """
+    if column == "id":
+        query_parts.append(" AND id < ?" if descending else " AND id > ?")
+        params.append(after[-1])
+        return
+
+    value, last_id = after
+    cmp, id_cmp = ("<", "<") if descending else (">", ">")
+    if value is None:
+        cond = f"({column} IS NULL AND id {id_cmp} ?)"
+        if not descending:
+            cond = f"({cond} OR {column} IS NOT NULL)"
+        params.append(last_id)
     else:
-        base_query_parts.append(" AND (" + " OR ".join(groups) + ")")
+        cond = f"({column} {cmp} ? OR ({column} = ? AND id {id_cmp} ?)"
+        cond += f" OR {column} IS NULL)" if descending else ")"
+        params.extend([value, value, last_id])
+    query_parts.append(" AND " + cond)
+
+
+def hotel_cursor(row, order_by: str = "id") -> tuple:
+    """Курсор keyset-пагинации для строки fetch_hotels: (значение ключа сортировки, id)."""
+    return (row[order_by], row["id"])
 
 
 def fetch_hotels(city=None, max_price=None,
                  any_types=None, all_types=None,
-                 any_plans=None, all_plans=None):
+                 any_plans=None, all_plans=None,
+                 min_price=None, min_rating=None,
+                 order_by="id", descending=False, after=None, limit=None):
+    """Отели по фильтрам. Для постраничного вывода: limit + after=hotel_cursor(последняя строка)."""
+    if order_by not in HOTEL_SORT_KEYS:
+        raise ValueError(f"unsupported order_by: {order_by!r}")
 
     with get_connection() as conn:
         cur = conn.cursor()
@@ -218,26 +664,61 @@ def fetch_hotels(city=None, max_price=None,
             query_parts.append(" AND city = ?")
             params.append(city)
 
+        if min_price is not None:
+            query_parts.append(" AND price >= ?")
+            params.append(min_price)
+
         if max_price is not None:
             query_parts.append(" AND price <= ?")
             params.append(max_price)
 
+        if min_rating is not None:
+            query_parts.append(" AND rating >= ?")
+            params.append(min_rating)
+
         if any_types:
-            _add_token_filters_sql(query_parts, params, "roomtype", any_types, require_all=False)
+            _add_token_filters_sql(query_parts, params, "hotel_roomtypes", "roomtype", any_types, require_all=False)
 
         if all_types:
-            _add_token_filters_sql(query_parts, params, "roomtype", all_types, require_all=True)
+            _add_token_filters_sql(query_parts, params, "hotel_roomtypes", "roomtype", all_types, require_all=True)
 
         if any_plans:
-            _add_token_filters_sql(query_parts, params, "rateplan", any_plans, require_all=False)
+            _add_token_filters_sql(query_parts, params, "hotel_amenities", "amenity", any_plans, require_all=False)
 
         if all_plans:
-            _add_token_filters_sql(query_parts, params, "rateplan", all_plans, require_all=True)
+            _add_token_filters_sql(query_parts, params, "hotel_amenities", "amenity", all_plans, require_all=True)
+
+        if after is not None:
+            _add_keyset_sql(query_parts, params, order_by, after, descending)
+
+        direction = "DESC" if descending else "ASC"
+        if order_by == "id":
+            query_parts.append(f"ORDER BY id {direction}")
+        else:
+            query_parts.append(f"ORDER BY {order_by} {direction}, id {direction}")
+
+        if limit is not None:
+            query_parts.append("LIMIT ?")
+            params.append(int(limit))
 
         cur.execute(" ".join(query_parts), tuple(params))
         return cur.fetchall()
 
 
+def fetch_hotel_cities() -> List[str]:
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT city FROM hotels WHERE city IS NOT NULL AND city != '' ORDER BY city"
+        ).fetchall()
+    return [str(r[0]) for r in rows]
+
+
+def fetch_max_hotel_price() -> Optional[float]:
+    with get_connection() as conn:
+        row = conn.execute("SELECT MAX(price) FROM hotels").fetchone()
+    return row[0] if row else None
+
+
 def insert_booking(user_id, hotel_id, check_in, check_out, guests):
     with get_connection() as conn:
         cur = conn.cursor()
@@ -245,8 +726,10 @@ def insert_booking(user_id, hotel_id, check_in, check_out, guests):
             INSERT INTO bookings (user_id, hotel_id, check_in, check_out, guests)
             VALUES (?, ?, ?, ?, ?)
         """, (user_id, hotel_id, check_in, check_out, guests))
+        booking_id = cur.lastrowid
+        record_changes(cur, ("bookings",), (("bookings", booking_id), ("hotels", hotel_id), ("users", user_id)))
         conn.commit()
-        return cur.lastrowid
+        return booking_id
 
 
 def fetch_user_by_email(email):
@@ -292,7 +775,6 @@ def fetch_partner_bookings(partner_id):
 
 def delete_hotel_owned(hotel_id, owner_id, is_admin=False):
     with get_connection() as conn:
-        conn.execute("PRAGMA foreign_keys = ON;")
         cur = conn.cursor()
 
         cur.execute("SELECT owner_id FROM hotels WHERE id = ?", (hotel_id,))
@@ -303,19 +785,27 @@ def delete_hotel_owned(hotel_id, owner_id, is_admin=False):
         if not is_admin and row[0] != owner_id:
             return False
 
+        bookings = cur.execute("SELECT id, user_id FROM bookings WHERE hotel_id = ?", (hotel_id,)).fetchall()
         cur.execute("DELETE FROM bookings WHERE hotel_id = ?", (hotel_id,))
         cur.execute("DELETE FROM hotels WHERE id = ?", (hotel_id,))
+        deleted = cur.rowcount > 0
+        record_changes(
+            cur,
+            ("hotels", "bookings") if bookings else ("hotels",),
+            [("hotels", hotel_id)]
+            + [("bookings", b[0]) for b in bookings]
+            + [("users", b[1]) for b in bookings],
+        )
         conn.commit()
-        return cur.rowcount > 0
+        return deleted
 
 
 def delete_booking_owned(booking_id, owner_id, is_admin=False):
     with get_connection() as conn:
-        conn.execute("PRAGMA foreign_keys = ON;")
         cur = conn.cursor()
 
         cur.execute("""
-            SELECT h.owner_id
+            SELECT h.owner_id, b.hotel_id, b.user_id
             FROM bookings b
             JOIN hotels h ON b.hotel_id = h.id
             WHERE b.id = ?
@@ -328,8 +818,10 @@ def delete_booking_owned(booking_id, owner_id, is_admin=False):
             return False
 
         cur.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+        deleted = cur.rowcount > 0
+        record_changes(cur, ("bookings",), (("bookings", booking_id), ("hotels", row[1]), ("users", row[2])))
         conn.commit()
-        return cur.rowcount > 0
+        return deleted
 
 
 def insert_hotel(owner_id, name, city, price, rating, rooms, available, roomtype, rateplan):
@@ -346,73 +838,265 @@ def insert_hotel(owner_id, name, city, price, rating, rooms, available, roomtype
                 owner_id, name, city, price, rating, rooms, available,
                 roomtype, rateplan
             ))
+            hotel_id = cur.lastrowid
+            sync_hotel_tokens(cur, [hotel_id])
+            record_changes(cur, ("hotels",), (("hotels", hotel_id),))
             conn.commit()
-            return cur.lastrowid
+            return hotel_id
     except Exception as e:
         print("insert_hotel error:", repr(e))
         return None
 
 
+def fetch_prices_batch(
+    rate_ids: Iterable[int], start: date, end: date, columnar: bool = False
+) -> Dict[int, Union[Tuple[Price, ...], PriceBatch]]:
+    """Цены по нескольким тарифам за [start, end) одним запросом (IN, по 500 id на запрос).
+
+    columnar=True — PriceBatch на тариф (столбцы-массивы, без объекта на строку).
+    """
+    ids = sorted(set(int(r) for r in rate_ids))
+    out = {rid: PriceBatch() if columnar else [] for rid in ids}
+
+    with get_connection() as conn:
+        for chunk in _chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(f"""
+                SELECT id, rate_id, date, amount, currency, day
+                FROM prices
+                WHERE rate_id IN ({marks})
+                  AND day >= ?
+                  AND day < ?
+                ORDER BY rate_id, day ASC
+            """, (*chunk, start.toordinal(), end.toordinal())).fetchall()
+            for r in rows:
+                if columnar:
+                    out[int(r[1])].append(int(r[0]), int(r[1]), r[2], int(r[3]), r[4], r[5])
+                else:
+                    out[int(r[1])].append(Price(int(r[0]), int(r[1]), r[2], int(r[3]), r[4], r[5]))
+
+    return out if columnar else {rid: tuple(v) for rid, v in out.items()}
+
+
+def fetch_availability_batch(
+    room_type_ids: Iterable[int], start: date, end: date, columnar: bool = False
+) -> Dict[int, Union[Tuple[Availability, ...], AvailabilityBatch]]:
+    """Остатки по нескольким типам номеров за [start, end) одним запросом (columnar — AvailabilityBatch)."""
+    ids = sorted(set(int(r) for r in room_type_ids))
+    out = {rt: AvailabilityBatch() if columnar else [] for rt in ids}
+
+    with get_connection() as conn:
+        for chunk in _chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(f"""
+                SELECT id, room_type_id, date, available, day
+                FROM availability
+                WHERE room_type_id IN ({marks})
+                  AND day >= ?
+                  AND day < ?
+                ORDER BY room_type_id, day ASC
+            """, (*chunk, start.toordinal(), end.toordinal())).fetchall()
+            for r in rows:
+                if columnar:
+                    out[int(r[1])].append(int(r[0]), int(r[1]), r[2], int(r[3]), r[4])
+                else:
+                    out[int(r[1])].append(Availability(int(r[0]), int(r[1]), r[2], int(r[3]), r[4]))
+
+    return out if columnar else {rt: tuple(v) for rt, v in out.items()}
+
+
+def fetch_calendar_batch(
+    pairs: Iterable[Tuple[int, int]], start: date, end: date, columnar: bool = False
+) -> Dict[Tuple[int, int], tuple]:
+    """(room_type_id, rate_id) -> (цены, остатки) за [start, end): по одному запросу на таблицу."""
+    pairs = list(dict.fromkeys((int(rt), int(rp)) for rt, rp in pairs))
+    prices = fetch_prices_batch((rp for _, rp in pairs), start, end, columnar)
+    avails = fetch_availability_batch((rt for rt, _ in pairs), start, end, columnar)
+    return {(rt, rp): (prices[rp], avails[rt]) for rt, rp in pairs}
+
+
 def fetch_prices_for_calendar(rate_id, month_start):
-    ensure_calendar_tables()
     grid_start, grid_end = month_grid_bounds(month_start)
+    return fetch_prices_batch([rate_id], grid_start, grid_end)[int(rate_id)]
+
+
+def fetch_availability_for_calendar(room_type_id, month_start):
+    grid_start, grid_end = month_grid_bounds(month_start)
+    return fetch_availability_batch([room_type_id], grid_start, grid_end)[int(room_type_id)]
+
+
+# Окна материализованного агрегата rate_window_mins (дней от сегодня).
+WINDOW_SIZES = (7, 30, 60, 90)
+
+
+def refresh_rate_window_mins(
+    cur,
+    rate_ids: Optional[Iterable[int]] = None,
+    start_day: Optional[int] = None,
+    touched_day: Optional[int] = None,
+):
+    """Пересчитывает rate_window_mins в транзакции записи.
+
+    rate_ids=None — все тарифы с ценами или записью в rate_plans; start_day — начало окон
+    (по умолчанию сегодня); touched_day — пересчитать только окна, в которые попадает
+    изменённый день. Тарифу из rate_plans нужен остаток его типа номера; для тарифа без
+    rate_plans тип номера неизвестен — минимум берётся только по ценам (room_type_id NULL).
+    Минимум по окну — range scan по idx_prices_rate_day/idx_avail_rt_day, не вся история цен.
+    """
+    start = start_day if start_day is not None else date.today().toordinal()
+    windows = [w for w in WINDOW_SIZES if touched_day is None or start <= touched_day < start + w]
+    if not windows:
+        return
+
+    sql = """
+        INSERT INTO rate_window_mins(rate_id, window_days, start_day, room_type_id, min_price)
+        SELECT r.rate_id, ?, ?, rp.room_type_id, CASE WHEN rp.id IS NULL THEN (
+            SELECT MIN(p.amount)
+            FROM prices p
+            WHERE p.rate_id = r.rate_id AND p.day >= ? AND p.day < ?
+        ) ELSE (
+            SELECT MIN(p.amount)
+            FROM prices p
+            JOIN availability a
+              ON a.room_type_id = rp.room_type_id AND a.day = p.day AND a.available > 0
+            WHERE p.rate_id = r.rate_id AND p.day >= ? AND p.day < ?
+        ) END
+        FROM (
+            SELECT DISTINCT rate_id FROM prices WHERE {where}
+            UNION SELECT id FROM rate_plans WHERE {where_rp}
+        ) r
+        LEFT JOIN rate_plans rp ON rp.id = r.rate_id
+        WHERE true
+        ON CONFLICT(rate_id, window_days) DO UPDATE
+        SET start_day = excluded.start_day, room_type_id = excluded.room_type_id, min_price = excluded.min_price
+    """
+    if rate_ids is None:
+        chunks = [[]]
+    else:
+        chunks = list(_chunks(sorted(set(int(r) for r in rate_ids))))
+    for chunk in chunks:
+        marks = ",".join("?" * len(chunk))
+        where, where_rp = (f"rate_id IN ({marks})", f"id IN ({marks})") if rate_ids is not None else ("1", "1")
+        for w in windows:
+            cur.execute(sql.format(where=where, where_rp=where_rp),
+                        (w, start, start, start + w, start, start + w, *chunk, *chunk))
+
+
+def _current_window_start(cur) -> int:
+    """Начало окон агрегата: сегодня либо день, на котором его оставил последний сдвиг."""
+    row = cur.execute("SELECT MAX(start_day) FROM rate_window_mins").fetchone()
+    return row[0] if row and row[0] is not None else date.today().toordinal()
 
+
+def shift_rate_window_mins(today: Optional[date] = None) -> bool:
+    """Сдвигает окна всех тарифов на today (раз в день) либо строит пустой агрегат при
+    наличии цен. True — пересчёт был нужен."""
+    start = (today or date.today()).toordinal()
     with get_connection() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT id, rate_id, date, amount, currency
-            FROM prices
-            WHERE rate_id = ?
-              AND date >= ?
-              AND date < ?
-            ORDER BY date ASC
-        """, (rate_id, grid_start.isoformat(), grid_end.isoformat()))
+        stale = cur.execute(
+            "SELECT 1 FROM rate_window_mins WHERE start_day != ? LIMIT 1", (start,)
+        ).fetchone()
+        empty = (
+            cur.execute("SELECT 1 FROM rate_window_mins LIMIT 1").fetchone() is None
+            and cur.execute("SELECT 1 FROM prices LIMIT 1").fetchone() is not None
+        )
+        if not stale and not empty:
+            return False
+        refresh_rate_window_mins(cur, start_day=start)
+        conn.commit()
+    return True
 
-        rows = cur.fetchall()
 
-    return tuple(Price(int(r[0]), int(r[1]), r[2], int(r[3]), r[4]) for r in rows)
+def fetch_rate_window_mins(
+    window_days: int,
+    rate_ids: Optional[Iterable[int]] = None,
+    today: Optional[date] = None,
+) -> WindowMins:
+    """rate_id -> минимальная доступная цена в окне window_days от today (None — нет такой).
 
+    Одна строка на тариф вместо скана цен; устаревшие окна сначала сдвигаются.
+    room_types результата — тип номера, по остатку которого взят минимум (None — без остатков).
+    """
+    if window_days not in WINDOW_SIZES:
+        raise ValueError(f"window_days must be one of {WINDOW_SIZES}, got {window_days!r}")
+    shift_rate_window_mins(today)
+
+    sql = "SELECT rate_id, min_price, room_type_id FROM rate_window_mins WHERE window_days = ?"
+    with get_connection() as conn:
+        if rate_ids is None:
+            rows = conn.execute(sql, (window_days,)).fetchall()
+        else:
+            rows = []
+            for chunk in _chunks(sorted(set(int(r) for r in rate_ids))):
+                marks = ",".join("?" * len(chunk))
+                rows += conn.execute(f"{sql} AND rate_id IN ({marks})", (window_days, *chunk)).fetchall()
+    return WindowMins(window_days, ((int(r[0]), r[1]) for r in rows), {int(r[0]): r[2] for r in rows})
+
+
+def _sql_day(cur, date_iso: str) -> int:
+    """День date_iso так, как его посчитает генерируемая колонка day."""
+    return cur.execute(f"SELECT {SQL_DAY_ORDINAL.format(col='?')}", (date_iso,)).fetchone()[0]
 
-def fetch_availability_for_calendar(room_type_id, month_start):
-    ensure_calendar_tables()
-    grid_start, grid_end = month_grid_bounds(month_start)
 
+def upsert_price(rate_id: int, date_iso: str, amount: int, currency: str = "KZT"):
+    """Цена тарифа на день (все записи этого дня); агрегат окон обновляется точечно."""
     with get_connection() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT id, room_type_id, date, available
-            FROM availability
-            WHERE room_type_id = ?
-              AND date >= ?
-              AND date < ?
-            ORDER BY date ASC
-        """, (room_type_id, grid_start.isoformat(), grid_end.isoformat()))
-        rows = cur.fetchall()
+        day = _sql_day(cur, date_iso)
+        cur.execute(
+            "UPDATE prices SET amount = ?, currency = ?, date = ? WHERE rate_id = ? AND day = ?",
+            (amount, currency, date_iso, rate_id, day),
+        )
+        if cur.rowcount == 0:
+            cur.execute(
+                "INSERT INTO prices (rate_id, date, amount, currency) VALUES (?, ?, ?, ?)",
+                (rate_id, date_iso, amount, currency),
+            )
+        refresh_rate_window_mins(cur, [rate_id], _current_window_start(cur), touched_day=day)
+        record_changes(cur, ("prices",), (("rates", rate_id),))
+        conn.commit()
 
-    return tuple(Availability(int(r[0]), int(r[1]), r[2], int(r[3])) for r in rows)
+
+def upsert_availability(room_type_id: int, date_iso: str, available: int):
+    """Остаток типа номера на день; пересчитываются окна только его тарифов."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        day = _sql_day(cur, date_iso)
+        cur.execute(
+            "UPDATE availability SET available = ?, date = ? WHERE room_type_id = ? AND day = ?",
+            (available, date_iso, room_type_id, day),
+        )
+        if cur.rowcount == 0:
+            cur.execute(
+                "INSERT INTO availability (room_type_id, date, available) VALUES (?, ?, ?)",
+                (room_type_id, date_iso, available),
+            )
+        rate_ids = [r[0] for r in cur.execute("SELECT id FROM rate_plans WHERE room_type_id = ?", (room_type_id,))]
+        if rate_ids:
+            refresh_rate_window_mins(cur, rate_ids, _current_window_start(cur), touched_day=day)
+        record_changes(cur, ("availability",), (("room_types", room_type_id),))
+        conn.commit()
 
 
 def fetch_rules_for_rate(room_type_id, rate_id):
-    ensure_calendar_tables()
+    """Правила, применимые к (room_type_id, rate_id): колонка совпадает или не задана (NULL).
 
+    Четыре ветки UNION ALL — каждая идёт по индексу idx_rules_scope; JSON не разбирается.
+    """
+    select = "SELECT id, kind, room_type_id, rate_id, date, value FROM rules WHERE"
     with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, kind, payload FROM rules")
-        rows = cur.fetchall()
+        rows = conn.execute(f"""
+            {select} rate_id = ? AND room_type_id = ?
+            UNION ALL {select} rate_id = ? AND room_type_id IS NULL
+            UNION ALL {select} rate_id IS NULL AND room_type_id = ?
+            UNION ALL {select} rate_id IS NULL AND room_type_id IS NULL
+            ORDER BY id
+        """, (rate_id, room_type_id, rate_id, room_type_id)).fetchall()
 
     out = []
     for r in rows:
-        try:
-            payload = json.loads(r[2]) if r[2] else {}
-        except Exception:
-            payload = {}
-
-        if payload:
-            if payload.get("room_type_id") not in (None, room_type_id):
-                continue
-            if payload.get("rate_id") not in (None, rate_id):
-                continue
-
+        payload = {k: r[k] for k in RULE_COLUMNS if r[k] is not None}
         out.append(Rule(int(r[0]), r[1], payload))
 
     return tuple(out)
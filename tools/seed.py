@@ -0,0 +1,234 @@
+# tools/seed.py
+"""Bulk-загрузка сид-данных.
+
+Файл читается потоково пачками (tools.utils.iter_json_arrays), каждая пачка заливается
+executemany в общей транзакции; вторичные индексы снимаются до заливки и строятся после неё.
+
+    python -m tools.seed Data/seed.json
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from tools import db
+from tools.utils import iter_json_arrays
+
+
+class TableLoadStats(NamedTuple):
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float(self.rows)
+
+    def __str__(self) -> str:
+        return f"{self.table}: {self.rows} rows in {self.seconds:.3f}s ({self.rows_per_sec:,.0f} rows/s)"
+
+
+class TableSpec(NamedTuple):
+    table: str
+    sql: str
+    to_row: Callable[[dict], tuple]
+    # вызывается в той же транзакции после каждой пачки: (cursor, records) -> None
+    after_batch: Optional[Callable[[Any, List[dict]], Any]] = None
+    # сущности журнала изменений, затронутые записью (см. db.record_changes)
+    entities: Callable[[dict], Iterable[db.Entity]] = lambda r: ()
+
+
+def _list_to_csv(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        items = [str(t).strip() for t in value if t]
+        return ",".join(items)
+    if isinstance(value, str):
+        return value.strip() or None
+    return str(value)
+
+
+def _hotel_row(h: dict) -> tuple:
+    return (
+        h["id"], h.get("name"), h.get("city"), h.get("price"), h.get("rating"),
+        h.get("rooms"), int(h.get("available", 0)),
+        _list_to_csv(h.get("roomtype")), _list_to_csv(h.get("rateplan")),
+        h.get("owner_id"),
+    )
+
+
+def _user_row(u: dict) -> tuple:
+    return (u["id"], u["username"], u["email"], u["password"], u["role"])
+
+
+def _booking_row(b: dict) -> tuple:
+    return (b["id"], b["user_id"], b["hotel_id"], b["check_in"], b["check_out"], b["guests"])
+
+
+def _price_row(p: dict) -> tuple:
+    return (p.get("id"), p["rate_id"], p["date"], p["amount"], p.get("currency", "KZT"))
+
+
+def _availability_row(a: dict) -> tuple:
+    return (a.get("id"), a["room_type_id"], a["date"], a["available"])
+
+
+def _rate_plan_row(r: dict) -> tuple:
+    return (
+        r["id"], r.get("hotel_id"), r["room_type_id"], r.get("title"), r.get("meal"),
+        int(bool(r.get("refundable", False))), r.get("cancel_before_days"),
+    )
+
+
+def _rule_row(r: dict) -> tuple:
+    payload = r.get("payload", {})
+    return (r.get("id"), r["kind"], json.dumps(payload), *db.rule_columns(payload))
+
+
+# Порядок важен: bookings ссылаются на users/hotels (foreign_keys = ON).
+# Записи с уже известным id обновляются: повторная заливка изменённого сида применяет правки.
+TABLE_SPECS = (
+    TableSpec("hotels", """
+        INSERT INTO hotels
+        (id, name, city, price, rating, rooms, available, roomtype, rateplan, owner_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name, city = excluded.city, price = excluded.price,
+            rating = excluded.rating, rooms = excluded.rooms, available = excluded.available,
+            roomtype = excluded.roomtype, rateplan = excluded.rateplan, owner_id = excluded.owner_id
+    """, _hotel_row, lambda cur, batch: db.sync_hotel_tokens(cur, [h["id"] for h in batch]),
+        lambda h: (("hotels", h["id"]),)),
+    TableSpec("users", """
+        INSERT OR IGNORE INTO users (id, username, email, password, role)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            username = excluded.username, email = excluded.email,
+            password = excluded.password, role = excluded.role
+    """, _user_row, entities=lambda u: (("users", u["id"]),)),
+    TableSpec("bookings", """
+        INSERT INTO bookings (id, user_id, hotel_id, check_in, check_out, guests)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            user_id = excluded.user_id, hotel_id = excluded.hotel_id, check_in = excluded.check_in,
+            check_out = excluded.check_out, guests = excluded.guests
+    """, _booking_row, entities=lambda b: (
+        ("bookings", b["id"]), ("hotels", b["hotel_id"]), ("users", b["user_id"]),
+    )),
+    TableSpec("prices", """
+        INSERT OR REPLACE INTO prices(id, rate_id, date, amount, currency)
+        VALUES(?,?,?,?,?)
+    """, _price_row, entities=lambda p: (("rates", p["rate_id"]),)),
+    TableSpec("availability", """
+        INSERT OR REPLACE INTO availability(id, room_type_id, date, available)
+        VALUES(?,?,?,?)
+    """, _availability_row, entities=lambda a: (("room_types", a["room_type_id"]),)),
+    TableSpec("rate_plans", """
+        INSERT OR REPLACE INTO rate_plans(id, hotel_id, room_type_id, title, meal, refundable, cancel_before_days)
+        VALUES(?,?,?,?,?,?,?)
+    """, _rate_plan_row, entities=lambda r: (("rates", r["id"]),)),
+    TableSpec("rules", """
+        INSERT OR REPLACE INTO rules(id, kind, payload, room_type_id, rate_id, date, value)
+        VALUES(?,?,?,?,?,?,?)
+    """, _rule_row),
+)
+
+
+SPECS_BY_TABLE = {spec.table: spec for spec in TABLE_SPECS}
+SEED_BATCH_SIZE = 5000
+
+
+class _Counter:
+    """Пропускает строки в executemany и считает их (executemany.rowcount не учитывает IGNORE/upsert)."""
+
+    def __init__(self, rows: Iterable[tuple]):
+        self._rows = iter(rows)
+        self.count = 0
+
+    def __iter__(self) -> Iterator[tuple]:
+        for row in self._rows:
+            self.count += 1
+            yield row
+
+
+Batches = Iterable[Tuple[str, Iterable[dict]]]
+
+
+def _ordered_batches(records: Mapping[str, Iterable[dict]]) -> Batches:
+    for spec in TABLE_SPECS:
+        if spec.table in records:
+            yield spec.table, records[spec.table]
+
+
+def bulk_load(
+    records: Union[Mapping[str, Iterable[dict]], Batches],
+    report: Optional[Callable[[TableLoadStats], Any]] = None,
+) -> List[TableLoadStats]:
+    """Заливает записи одной транзакцией.
+
+    records — {"hotels": [...], ...} либо поток пар (таблица, пачка записей) в любом порядке,
+    например из tools.utils.iter_json_arrays(). Неизвестные таблицы пропускаются.
+    report вызывается после каждой пачки с накопленной статистикой таблицы (прогресс).
+    """
+    if isinstance(records, Mapping):
+        records = _ordered_batches(records)
+
+    db.init_db()
+    totals: Dict[str, TableLoadStats] = {}
+    version: Optional[int] = None
+
+    with db.get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        # в потоке bookings могут прийти раньше users/hotels — проверяем FK на коммите
+        cur.execute("PRAGMA defer_foreign_keys = ON;")
+
+        for table, batch in records:
+            spec = SPECS_BY_TABLE.get(table)
+            if spec is None:
+                continue
+            if version is None:
+                # один номер изменения на всю загрузку; сущности отмечаются по пачкам
+                version = db.next_change_version(cur)
+            if table not in totals:
+                db.drop_indexes(cur, (table,))
+                totals[table] = TableLoadStats(table, 0, 0.0)
+
+            started = time.perf_counter()
+            batch = list(batch)
+            rows = _Counter(spec.to_row(r) for r in batch)
+            cur.executemany(spec.sql, rows)
+            if spec.after_batch:
+                spec.after_batch(cur, batch)
+            db.record_changes(cur, (), (e for r in batch for e in spec.entities(r)), version)
+            prev = totals[table]
+            totals[table] = stat = TableLoadStats(
+                table, prev.rows + rows.count, prev.seconds + time.perf_counter() - started
+            )
+            if report:
+                report(stat)
+
+        db.create_indexes(cur, totals)
+        if totals.keys() & {"prices", "availability", "rate_plans"}:
+            db.refresh_rate_window_mins(cur)
+        if totals:
+            db.record_changes(cur, totals, version=version)
+        conn.commit()
+
+    return list(totals.values())
+
+
+def load_seed(
+    seed_path: str = "Data/seed.json",
+    report=None,
+    batch_size: int = SEED_BATCH_SIZE,
+) -> List[TableLoadStats]:
+    """Потоковая заливка JSON-файла: память не зависит от размера файла."""
+    if not Path(seed_path).exists():
+        return []
+    return bulk_load(iter_json_arrays(seed_path, batch_size=batch_size), report=report)
+
+
+if __name__ == "__main__":
+    load_seed(sys.argv[1] if len(sys.argv) > 1 else "Data/seed.json", report=print)
@@ -16,3 +16,133 @@ def save_json(path: str, data: dict):
     p.parent.mkdir(parents=True, exist_ok=True)
     with open(p, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def parse_list_field(raw) -> list[str]:
+    """Принимает CSV/JSON/список/строку и возвращает список строк."""
+    if raw is None:
+        return []
+    if isinstance(raw, list):
+        return [str(x).strip() for x in raw if str(x).strip()]
+    if isinstance(raw, str):
+        s = raw.strip()
+        if not s:
+            return []
+        try:
+            v = json.loads(s)
+            if isinstance(v, list):
+                return [str(x).strip() for x in v if str(x).strip()]
+            if isinstance(v, dict):
+                return [str(k).strip() for k in v.keys() if str(k).strip()]
+        except Exception:
+            pass
+        return [t.strip() for t in s.split(",") if t.strip()]
+    return [str(raw).strip()] if str(raw).strip() else []
+
+
+def norm_token(s: str) -> str:
+    """'Wi-Fi' -> 'wifi': ключ для сравнения типов номеров/услуг."""
+    return "".join(ch for ch in str(s).lower() if ch.isalnum())
+
+
+_WS = " \t\n\r"
+_NUMBER_END = _WS + ",]}"
+
+
+class _JsonStream:
+    """Буфер над текстовым файлом для пошагового разбора JSON через raw_decode."""
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str):
+        got = self.peek()
+        if got != ch:
+            raise ValueError(f"JSON stream: expected {ch!r}, got {got!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # число заканчивается только разделителем: иначе его хвост ещё не прочитан
+            if (
+                isinstance(obj, (int, float)) and not isinstance(obj, bool)
+                and (end == len(self.buf) or self.buf[end] not in _NUMBER_END)
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_arrays(path: str, batch_size: int = 1000, chunk_size: int = 1 << 16):
+    """Потоково читает JSON-объект верхнего уровня вида {"hotels": [...], "prices": [...]}.
+
+    Отдаёт пары (ключ, пачка) в порядке файла: массивы — пачками не длиннее batch_size,
+    прочие значения — пачкой из одного элемента. Память ограничена пачкой и буфером чтения.
+    """
+    p = Path(path)
+    if not p.exists():
+        return
+    with open(p, "r", encoding="utf-8") as f:
+        s = _JsonStream(f, chunk_size)
+        if s.peek() == "":
+            return
+        s.expect("{")
+        first = True
+        while s.peek() != "}":
+            if not first:
+                s.expect(",")
+            first = False
+            key = s.value()
+            s.expect(":")
+            if s.peek() != "[":
+                yield key, [s.value()]
+                continue
+
+            s.expect("[")
+            batch = []
+            first_item = True
+            while s.peek() != "]":
+                if not first_item:
+                    s.expect(",")
+                first_item = False
+                batch.append(s.value())
+                if len(batch) >= batch_size:
+                    yield key, batch
+                    batch = []
+            s.expect("]")
+            if batch:
+                yield key, batch
+        s.expect("}")